@@ -0,0 +1,99 @@
+"""
+Measure the per-object cost of turning a downloaded anchor into fetch queue
+work items and parsing them in the download threads.
+
+    python benchmarks/fetch_objects.py [objects] [version]
+
+The old pipeline parsed the whole anchor, serialized every object again to
+queue it and parsed it once more when downloading it. The current pipeline
+splits the serialized anchor into an anchor file without parsing the
+objects, and each object is parsed only when it is downloaded.
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from protos import anchor_pb2
+from utils.anchorfile import AnchorFile, split_anchor
+
+
+def build_anchor(count, version):
+    anchor = anchor_pb2.Anchor()
+    anchor.prev_anchor = hashlib.sha1(b'prev').hexdigest()
+    anchor.version = version
+    objects = []
+    for i in range(count):
+        sha = hashlib.sha1(str(i).encode('utf8')).digest()
+        obj = anchor_pb2.Object()
+        if i % 3:
+            obj.type = anchor_pb2.Object.BLOB
+            obj.content = b'\x12 ' + hashlib.sha256(sha).digest()
+            if version < 2:
+                obj.content = b'Qm' + obj.content.hex().encode('ascii')[:44]
+        else:
+            obj.type = anchor_pb2.Object.TREE
+            obj.content = os.urandom(200)
+        obj.size = len(obj.content)
+        objects.append((sha, obj))
+    for sha, obj in sorted(objects):
+        if version < 2:
+            anchor.objects[sha.hex()].CopyFrom(obj)
+        else:
+            entry = anchor.entries.add()
+            entry.sha = sha
+            entry.object.CopyFrom(obj)
+    return anchor.SerializeToString()
+
+
+def old_pipeline(data):
+    anchor = anchor_pb2.Anchor()
+    anchor.ParseFromString(data)
+    if anchor.version < 2:
+        objects = anchor.objects
+    else:
+        objects = dict((entry.sha.hex(), entry.object) for entry in anchor.entries)
+    for sha in objects:
+        proto = objects[sha].SerializeToString()
+        obj = anchor_pb2.Object()
+        obj.ParseFromString(proto)
+
+
+def new_pipeline(data, path):
+    header, objects = split_anchor(data)
+    with open(path, 'wb') as f:
+        AnchorFile.write(f, header, objects)
+    anchor = AnchorFile(path)
+    for sha in anchor:
+        obj = anchor_pb2.Object()
+        obj.ParseFromString(anchor[sha])
+    anchor.close()
+
+
+def measure(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    version = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    data = build_anchor(count, version)
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        old = min(measure(old_pipeline, data) for _ in range(3))
+        new = min(measure(new_pipeline, data, path) for _ in range(3))
+    finally:
+        os.remove(path)
+    print('%d objects, version %d anchor of %d bytes' % (count, version, len(data)))
+    print('parse, serialize, parse: %6.1f us per object' % (old / count * 1e6))
+    print('split, map, parse:       %6.1f us per object' % (new / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
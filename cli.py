@@ -6,6 +6,7 @@ Usage:
   lly account send <address> <amount>
   lly repo deploy [--gasprice=<gwei>] [--gaslimit=<gwei>]
   lly repo status <address>
+  lly repo history [<address>] [--ref=<ref>] [--from-block=<block>]
   lly repo create-bounty <address> <bountyid>
   lly contract (call|transact) <address> <function> [--args=<arguments>] [--gasprice=<gwei>] [--gaslimit=<gwei>]
   lly (-h | --help)
@@ -18,6 +19,8 @@ Options:
   --args=<arguments>    Arguments for call [default: []].
   --gasprice=<gwei>     Gas price in Gwei [default: 21].
   --gaslimit=<gwei>     Override gas limit in Gwei.
+  --ref=<ref>           Only show the pushes to this ref.
+  --from-block=<block>  Block to start indexing a repo at [default: 0].
 
 """
 from inspect import getmembers, isclass
@@ -34,6 +37,7 @@ if __name__ == '__main__':
         if v and hasattr(commands, k):
             module = getattr(commands, k)
             commands = getmembers(module, isclass)
-            command = [command[1] for command in commands if command[0] != 'Base' and command[0] != 'InitializedBase'][0]
+            # only the classes defined in the module, not the ones it imports
+            command = [command[1] for command in commands if command[0] != 'Base' and command[0] != 'InitializedBase' and command[1].__module__ == module.__name__][0]
             command = command(options)
             command.run()
@@ -4,6 +4,8 @@ from .initialized_base import InitializedBase
 import json
 import sys
 
+from utils.infura import RPCError
+
 class Contract(InitializedBase):
     """lly exec"""
 
@@ -14,7 +16,11 @@ class Contract(InitializedBase):
 
         def confirm():
             print("Creating transaction")
-            response = self.client.repo.transact(address, function, args)
+            try:
+                response = self.client.repo.transact(address, function, args)
+            except RPCError as e:
+                print("Error: %s" % e)
+                return
             if 'result' in response:
                 address = response['result']
                 print("Success. Transaction: %s" % address)
@@ -32,7 +38,11 @@ class Contract(InitializedBase):
         args = json.loads(self.options["--args"])
 
         print("Calling function %s::%s(%s)" % (address, function, json.dumps(args)))
-        response = self.client.repo.call(address, function, args)
+        try:
+            response = self.client.repo.call(address, function, args)
+        except RPCError as e:
+            print("Error: %s" % e)
+            return
         if 'result' in response:
             result = response['result']
             print("Success. Result: %s" % result)
@@ -29,7 +29,7 @@ class InitializedBase(object):
         gas_limit = int(self.options['--gaslimit']) if self.options['--gaslimit'] else default_gas_limit
 
         max_gas_gwei = gas_price * default_gas_limit
-        max_gas_usd = float(current_price()["bid"]) * (max_gas_gwei / denoms.gwei)
+        max_gas_usd = float(current_price(self.client.infura)["bid"]) * (max_gas_gwei / denoms.gwei)
 
         print("\n%s" % message)
         print("\nUsing:")
@@ -9,6 +9,8 @@ from ethereum.utils import denoms, encode_hex
 
 from utils.cli import query_yes_no
 from utils.eth import current_price, encode_address
+from utils.history import History
+from utils.infura import RPCError
 
 class Repo(InitializedBase):
     """lly repo commands"""
@@ -21,13 +23,19 @@ class Repo(InitializedBase):
             self.status()
         elif self.options['deploy']:
             self.deploy()
+        elif self.options['history']:
+            self.history()
         elif self.options['create-bounty']:
             self.create_bounty()
 
     def deploy(self):
         def confirm(gas_price, gas_limit):
             ref_head = "refs/heads/master"
-            contract_address, response = self.client.repo.create(ref_head, gas_price, gas_limit)
+            try:
+                contract_address, response = self.client.repo.create(ref_head, gas_price, gas_limit)
+            except RPCError as e:
+                print("\nError: %s" % e)
+                return
             if 'result' in response:
                 address = response['result']
                 print("\nContract deploying...")
@@ -40,10 +48,40 @@ class Repo(InitializedBase):
         def reject():
             print("Rejected")
 
-        self.execute("Deploying repository contract", 850000, confirm, reject)
+        self.execute("Deploying repository contract", 1000000, confirm, reject)
 
     def status(self):
+        try:
+            self._status()
+        except RPCError as e:
+            print("\nError: %s" % e)
+
+    def _status(self):
         address = self.options['<address>']
+        state = self.client.repo.get_state(address)
+        if state is None:
+            return self._status_head(address)
+        ref_head, refs, head_anchor = state
+
+        # the anchors of refs other than the head are read in one batch
+        other_hashes = [ref_hash for ref, ref_hash in refs if ref != ref_head]
+        anchors = {}
+        if other_hashes:
+            responses = self.client.repo.call_many(address, [('getAnchor', [ref_hash]) for ref_hash in other_hashes])
+            anchors = dict(zip(other_hashes, [response['result'][0] for response in responses]))
+
+        print("\n Repo: %s" % address)
+        print(" Head: %s" % ref_head)
+        print(" Refs (ref -> git hash -> ipfs hash):")
+        for ref, ref_hash in refs:
+            content_address = head_anchor if ref == ref_head else anchors[ref_hash]
+            if int.from_bytes(content_address, byteorder="little") > 0:
+                print("  ", ref, "->", encode_hex(ref_hash)[:40], "->", base58.b58encode(b'\x12 ' + content_address))
+            else:
+                print("  ", ref, "->", encode_hex(ref_hash)[:40])
+
+    def _status_head(self, address):
+        # contracts predating getState only list the head ref
         # Get head ref
         response = self.client.repo.call(address, 'getHead', [])
         ref_head = response['result'][0].decode("utf-8")
@@ -61,12 +99,50 @@ class Repo(InitializedBase):
         else:
             print("  ", ref_head, "->", encode_hex(ref_anchor)[:40])
 
+    def history(self):
+        history = History()
+        try:
+            self._history(history)
+        except RPCError as e:
+            print("\nError: %s" % e)
+        finally:
+            history.close()
+
+    def _history(self, history):
+        address = self.options['<address>']
+        if address is None:
+            # sync every repo indexed before
+            for address, _, _ in history.repos():
+                history.sync(self.client.repo, address)
+            print("\n Repos (address -> last block -> pushes):")
+            for address, block, count in history.repos():
+                print("  ", address, "->", block, "->", count)
+            return
+
+        history.sync(self.client.repo, address, int(self.options['--from-block']))
+        print("\n Repo: %s" % address)
+        pushes = history.pushes(address, self.options['--ref'])
+        if not pushes and self.client.repo.get_state(address, page_size=1) is None:
+            # Push events came with getState
+            print(" The contract predates Push events, its pushes cannot be listed")
+            return
+        print(" Pushes (block -> ref -> git hash -> ipfs hash):")
+        for block, txn, sender, ref, sha, anchor in pushes:
+            if anchor:
+                print("  ", block, "->", ref, "->", sha, "->", anchor)
+            else:
+                print("  ", block, "->", ref, "->", sha)
+
     def create_bounty(self):
         bounty_id = self.options['<bountyid>']
 
         def confirm(gas_price, gas_limit):
             address = self.options['<address>']
-            response = self.client.repo.transact(address, "createBounty", [bounty_id, 'active'], value=1, gasprice=gas_price, gaslimit=gas_limit)
+            try:
+                response = self.client.repo.transact(address, "createBounty", [bounty_id, 'active'], value=1, gasprice=gas_price, gaslimit=gas_limit)
+            except RPCError as e:
+                print("\nError: %s" % e)
+                return
             if 'result' in response:
                 address = response['result']
                 print("\nCreating transaction:")
@@ -4,6 +4,8 @@ contract Repo {
     mapping(address => bool) admins;
     mapping (string => bytes32) refs;
     mapping (bytes32 => bytes32) anchors;
+    mapping (string => bool) knownRefs;
+    string[] refNames;
     string headRef;
 
     modifier onlyAdmin {
@@ -11,6 +13,13 @@ contract Repo {
         _;
     }
 
+    event Push(
+        address indexed sender,
+        bytes32 indexed hash,
+        string ref,
+        bytes32 contentAddress
+    );
+
     event Bounty(
         address indexed sender,
         uint32 bountyId,
@@ -54,8 +63,70 @@ contract Repo {
     }
 
     function push(string ref, bytes32 hash, bytes32 content_address) public {
+        if (!knownRefs[ref]) {
+            knownRefs[ref] = true;
+            refNames.push(ref);
+        }
         refs[ref] = hash;
         anchors[hash] = content_address;
+        Push(msg.sender, hash, ref, content_address);
+    }
+
+    // Pushes several refs in a single transaction. The ref names are passed
+    // like getState returns them, each followed by a newline, as string[]
+    // cannot be passed to a public function.
+    function pushMany(bytes names, bytes32[] hashes, bytes32[] contentAddresses) public {
+        require(hashes.length == contentAddresses.length);
+        uint256 n = 0;
+        uint256 start = 0;
+        for (uint256 i = 0; i < names.length; i++) {
+            if (names[i] != byte(10)) {
+                continue;
+            }
+            require(n < hashes.length);
+            bytes memory ref = new bytes(i - start);
+            for (uint256 j = start; j < i; j++) {
+                ref[j - start] = names[j];
+            }
+            push(string(ref), hashes[n], contentAddresses[n]);
+            n++;
+            start = i + 1;
+        }
+        require(n == hashes.length);
+    }
+
+    // Returns the head ref, the names of up to limit refs starting at offset,
+    // each followed by a newline, their hashes, the anchor of the head ref and
+    // the total number of refs, so the state is read in a single call.
+    function getState(uint256 offset, uint256 limit) public constant returns (string head, bytes names, bytes32[] hashes, bytes32 headAnchor, uint256 total) {
+        total = refNames.length;
+        uint256 end = offset + limit;
+        if (end > total || end < offset) {
+            end = total;
+        }
+        if (offset > end) {
+            offset = end;
+        }
+
+        uint256 size = 0;
+        uint256 i;
+        for (i = offset; i < end; i++) {
+            size += bytes(refNames[i]).length + 1;
+        }
+        names = new bytes(size);
+        hashes = new bytes32[](end - offset);
+        uint256 k = 0;
+        for (i = offset; i < end; i++) {
+            bytes storage name = bytes(refNames[i]);
+            for (uint256 j = 0; j < name.length; j++) {
+                names[k++] = name[j];
+            }
+            names[k++] = byte(10);
+            hashes[i - offset] = refs[refNames[i]];
+        }
+
+        head = headRef;
+        headAnchor = anchors[refs[headRef]];
     }
 
     function createBounty(uint32 bountyid, string status) public payable onlyAdmin {
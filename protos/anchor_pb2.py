@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   name='anchor.proto',
   package='',
   syntax='proto3',
-  serialized_pb=_b('\n\x0c\x61nchor.proto\"\x80\x01\n\x06Object\x12 \n\x04type\x18\x01 \x01(\x0e\x32\x12.Object.ObjectType\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\x0c\x12\x0c\n\x04size\x18\x03 \x01(\x05\"5\n\nObjectType\x12\n\n\x06\x43OMMIT\x10\x00\x12\x08\n\x04TREE\x10\x01\x12\x08\n\x04\x42LOB\x10\x02\x12\x07\n\x03TAG\x10\x03\"}\n\x06\x41nchor\x12%\n\x07objects\x18\x01 \x03(\x0b\x32\x14.Anchor.ObjectsEntry\x12\x13\n\x0bprev_anchor\x18\x02 \x01(\t\x1a\x37\n\x0cObjectsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x16\n\x05value\x18\x02 \x01(\x0b\x32\x07.Object:\x02\x38\x01\x62\x06proto3')
+  serialized_pb=_b('\n\x0c\x61nchor.proto\"\xde\x01\n\x06Object\x12 \n\x04type\x18\x01 \x01(\x0e\x32\x12.Object.ObjectType\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\x0c\x12\x0c\n\x04size\x18\x03 \x01(\x05\x12\x0e\n\x06\x63hunks\x18\x04 \x03(\x0c\x12\x1c\n\x05\x63odec\x18\x05 \x01(\x0e\x32\r.Object.Codec\"5\n\nObjectType\x12\n\n\x06\x43OMMIT\x10\x00\x12\x08\n\x04TREE\x10\x01\x12\x08\n\x04\x42LOB\x10\x02\x12\x07\n\x03TAG\x10\x03\".\n\x05\x43odec\x12\x08\n\x04NONE\x10\x00\x12\x08\n\x04ZLIB\x10\x01\x12\x08\n\x04LZMA\x10\x02\x12\x07\n\x03\x42Z2\x10\x03\"\xf2\x02\n\x06\x41nchor\x12%\n\x07objects\x18\x01 \x03(\x0b\x32\x14.Anchor.ObjectsEntry\x12\x13\n\x0bprev_anchor\x18\x02 \x01(\t\x12\x0c\n\x04pack\x18\x03 \x01(\t\x12\x1b\n\x05pages\x18\x04 \x03(\x0b\x32\x0c.Anchor.Page\x12\x1c\n\x05\x63odec\x18\x05 \x01(\x0e\x32\r.Object.Codec\x12\x0f\n\x07payload\x18\x06 \x01(\x0c\x12\x0f\n\x07version\x18\x07 \x01(\r\x12\x1e\n\x07\x65ntries\x18\x08 \x03(\x0b\x32\r.Anchor.Entry\x12\x14\n\x0cprev_anchors\x18\t \x03(\t\x1a#\n\x04Page\x12\r\n\x05\x66irst\x18\x01 \x01(\t\x12\x0c\n\x04hash\x18\x02 \x01(\t\x1a-\n\x05\x45ntry\x12\x0b\n\x03sha\x18\x01 \x01(\x0c\x12\x17\n\x06object\x18\x02 \x01(\x0b\x32\x07.Object\x1a\x37\n\x0cObjectsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x16\n\x05value\x18\x02 \x01(\x0b\x32\x07.Object:\x02\x38\x01\x62\x06proto3')
 )
 
 
@@ -49,11 +49,41 @@ _OBJECT_OBJECTTYPE = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   options=None,
-  serialized_start=92,
-  serialized_end=145,
+  serialized_start=138,
+  serialized_end=191,
 )
 _sym_db.RegisterEnumDescriptor(_OBJECT_OBJECTTYPE)
 
+_OBJECT_CODEC = _descriptor.EnumDescriptor(
+  name='Codec',
+  full_name='Object.Codec',
+  filename=None,
+  file=DESCRIPTOR,
+  values=[
+    _descriptor.EnumValueDescriptor(
+      name='NONE', index=0, number=0,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='ZLIB', index=1, number=1,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='LZMA', index=2, number=2,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='BZ2', index=3, number=3,
+      options=None,
+      type=None),
+  ],
+  containing_type=None,
+  options=None,
+  serialized_start=193,
+  serialized_end=239,
+)
+_sym_db.RegisterEnumDescriptor(_OBJECT_CODEC)
+
 
 _OBJECT = _descriptor.Descriptor(
   name='Object',
@@ -83,12 +113,27 @@ _OBJECT = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='chunks', full_name='Object.chunks', index=3,
+      number=4, type=12, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='codec', full_name='Object.codec', index=4,
+      number=5, type=14, cpp_type=8, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
   nested_types=[],
   enum_types=[
     _OBJECT_OBJECTTYPE,
+    _OBJECT_CODEC,
   ],
   options=None,
   is_extendable=False,
@@ -97,10 +142,84 @@ _OBJECT = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=17,
-  serialized_end=145,
+  serialized_end=239,
 )
 
 
+_ANCHOR_PAGE = _descriptor.Descriptor(
+  name='Page',
+  full_name='Anchor.Page',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='first', full_name='Anchor.Page.first', index=0,
+      number=1, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='hash', full_name='Anchor.Page.hash', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=473,
+  serialized_end=508,
+)
+
+_ANCHOR_ENTRY = _descriptor.Descriptor(
+  name='Entry',
+  full_name='Anchor.Entry',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='sha', full_name='Anchor.Entry.sha', index=0,
+      number=1, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='object', full_name='Anchor.Entry.object', index=1,
+      number=2, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto3',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=510,
+  serialized_end=555,
+)
+
 _ANCHOR_OBJECTSENTRY = _descriptor.Descriptor(
   name='ObjectsEntry',
   full_name='Anchor.ObjectsEntry',
@@ -134,8 +253,8 @@ _ANCHOR_OBJECTSENTRY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=217,
-  serialized_end=272,
+  serialized_start=557,
+  serialized_end=612,
 )
 
 _ANCHOR = _descriptor.Descriptor(
@@ -159,10 +278,59 @@ _ANCHOR = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='pack', full_name='Anchor.pack', index=2,
+      number=3, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='pages', full_name='Anchor.pages', index=3,
+      number=4, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='codec', full_name='Anchor.codec', index=4,
+      number=5, type=14, cpp_type=8, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='payload', full_name='Anchor.payload', index=5,
+      number=6, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='version', full_name='Anchor.version', index=6,
+      number=7, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='entries', full_name='Anchor.entries', index=7,
+      number=8, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='prev_anchors', full_name='Anchor.prev_anchors', index=8,
+      number=9, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
-  nested_types=[_ANCHOR_OBJECTSENTRY, ],
+  nested_types=[_ANCHOR_PAGE, _ANCHOR_ENTRY, _ANCHOR_OBJECTSENTRY, ],
   enum_types=[
   ],
   options=None,
@@ -171,15 +339,23 @@ _ANCHOR = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=147,
-  serialized_end=272,
+  serialized_start=242,
+  serialized_end=612,
 )
 
 _OBJECT.fields_by_name['type'].enum_type = _OBJECT_OBJECTTYPE
+_OBJECT.fields_by_name['codec'].enum_type = _OBJECT_CODEC
 _OBJECT_OBJECTTYPE.containing_type = _OBJECT
+_OBJECT_CODEC.containing_type = _OBJECT
+_ANCHOR_PAGE.containing_type = _ANCHOR
+_ANCHOR_ENTRY.fields_by_name['object'].message_type = _OBJECT
+_ANCHOR_ENTRY.containing_type = _ANCHOR
 _ANCHOR_OBJECTSENTRY.fields_by_name['value'].message_type = _OBJECT
 _ANCHOR_OBJECTSENTRY.containing_type = _ANCHOR
 _ANCHOR.fields_by_name['objects'].message_type = _ANCHOR_OBJECTSENTRY
+_ANCHOR.fields_by_name['pages'].message_type = _ANCHOR_PAGE
+_ANCHOR.fields_by_name['codec'].enum_type = _OBJECT_CODEC
+_ANCHOR.fields_by_name['entries'].message_type = _ANCHOR_ENTRY
 DESCRIPTOR.message_types_by_name['Object'] = _OBJECT
 DESCRIPTOR.message_types_by_name['Anchor'] = _ANCHOR
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
@@ -193,6 +369,18 @@ _sym_db.RegisterMessage(Object)
 
 Anchor = _reflection.GeneratedProtocolMessageType('Anchor', (_message.Message,), dict(
 
+  Page = _reflection.GeneratedProtocolMessageType('Page', (_message.Message,), dict(
+    DESCRIPTOR = _ANCHOR_PAGE,
+    __module__ = 'anchor_pb2'
+    # @@protoc_insertion_point(class_scope:Anchor.Page)
+    ))
+  ,
+  Entry = _reflection.GeneratedProtocolMessageType('Entry', (_message.Message,), dict(
+    DESCRIPTOR = _ANCHOR_ENTRY,
+    __module__ = 'anchor_pb2'
+    # @@protoc_insertion_point(class_scope:Anchor.Entry)
+    ))
+  ,
   ObjectsEntry = _reflection.GeneratedProtocolMessageType('ObjectsEntry', (_message.Message,), dict(
     DESCRIPTOR = _ANCHOR_OBJECTSENTRY,
     __module__ = 'anchor_pb2'
@@ -204,6 +392,8 @@ Anchor = _reflection.GeneratedProtocolMessageType('Anchor', (_message.Message,),
   # @@protoc_insertion_point(class_scope:Anchor)
   ))
 _sym_db.RegisterMessage(Anchor)
+_sym_db.RegisterMessage(Anchor.Page)
+_sym_db.RegisterMessage(Anchor.Entry)
 _sym_db.RegisterMessage(Anchor.ObjectsEntry)
 
 
@@ -25,14 +25,20 @@
 #!/usr/bin/env python
 
 import base58
+import binascii
+import collections
+import hashlib
+import itertools
 import json
 import multiprocessing
 import multiprocessing.dummy
 import multiprocessing.pool
 import os
 import posixpath
+import struct
 import subprocess
 import sys
+import threading
 import time
 import zlib
 try:
@@ -43,14 +49,33 @@ except ImportError:
 from ethereum.utils import denoms, encode_hex, decode_hex
 
 from protos import anchor_pb2
+from utils.anchorfile import split_anchor
+from utils.cache import AnchorCache
+from utils.chunker import Chunker
 from utils.client import Client
+from utils.codec import CODECS
+from utils.index import ObjectIndex
 from utils.eth import current_price
+from utils.infura import RPCError
 
 __version__ = '0.1.0'
 
 DEVNULL = open(os.devnull, 'w')
 PROCESSES = 20
 MAX_RETRIES = 3
+BATCH_SIZE = 4096  # objects per git cat-file --batch-check round trip
+HASH_POOL_THRESHOLD = 1 << 20  # objects of at least this size may be hashed in the process pool
+PAGE_SIZE = 10000  # objects per anchor page, larger anchors are split into pages
+PAGE_PREFETCH = 4  # anchor pages downloaded ahead of the page being fetched
+ANCHOR_PREFETCH = 4  # anchors resolved ahead of the anchor being fetched
+ANCHOR_CACHE_SIZE = 256 << 20  # default size of the anchor cache in bytes
+STREAM_THRESHOLD = 16 << 20  # blobs of at least this size are streamed to ipfs
+PACK_READ_SIZE = 1 << 20  # bytes of a downloaded pack copied to git at a time
+CHUNK_PREFETCH = 8  # chunks of a chunked blob downloaded in parallel
+PUSH_GAS_LIMIT = 60000  # gas limit of a push transaction, besides its refs
+PUSH_REF_GAS_LIMIT = 110000  # gas limit added for every ref of a push transaction
+PUSH_REF_BYTE_GAS_LIMIT = 400  # gas limit added for every byte of a ref name
+PUSH_REF_WORD_GAS_LIMIT = 22200  # gas limit added for every storage word of a ref name of 32 bytes or more
 
 client = Client()
 
@@ -107,6 +132,13 @@ def git_command_ok(*args):
     return subprocess.call(args, stdout=DEVNULL, stderr=DEVNULL) == 0
 
 
+def git_dir():
+    """
+    Return the path of the repository's git directory.
+    """
+    return os.path.abspath(git_command_output('rev-parse', '--git-dir'))
+
+
 def git_is_ancestor(ancestor, ref):
     """
     Return whether ancestor is an ancestor of ref.
@@ -138,37 +170,20 @@ def git_ref_value(ref):
     return git_command_output('rev-parse', ref)
 
 
-def git_object_type(sha):
-    """
-    Return the type of the object.
-    """
-    return git_command_output('cat-file', '-t', sha)
-
-
-def git_object_data(sha, kind=None):
-    """
-    Return the contents of the object.
-
-    If kind is None, return a pretty-printed representation of the object.
-    """
-    if kind is not None:
-        return git_command_output('cat-file', kind, sha, decode=False, strip=False)
-    else:
-        return git_command_output('cat-file', '-p', sha, decode=False, strip=False)
-
-
-def git_encode_object(sha):
+def git_encode_object(sha, cat_file):
     """
     Return the encoded contents of the object.
 
-    The encoding is identical to the encoding git uses for loose objects.
+    The encoding is identical to the encoding git uses for loose objects. The
+    object is read through cat_file, a shared `GitCatFile`.
+
+    Blobs are stored on ipfs, so their contents are only returned and not
+    copied into the encoded object.
 
     This operation is the inverse of `git_decode_object`.
     """
 
-    kind = git_object_type(sha)
-    size = git_command_output('cat-file', '-s', sha)
-    contents = git_object_data(sha, kind)
+    kind, size, contents = cat_file.read(sha)
 
     obj = anchor_pb2.Object()
 
@@ -181,80 +196,163 @@ def git_encode_object(sha):
     elif kind == 'tag':
         obj.type = anchor_pb2.Object.TAG
 
-    obj.content = contents
-    obj.size = int(size)
+    if obj.type != anchor_pb2.Object.BLOB:
+        obj.content = contents
+    obj.size = size
 
     return obj, contents
 
 
-def git_decode_object(obj):
+def git_blob_stream(sha):
     """
-    Decode the object, write it, and return the computed hash.
-
-    This operation is the inverse of `git_encode_object`.
+    Return a process that writes the contents of the blob to its stdout.
     """
+    return subprocess.Popen(['git', 'cat-file', 'blob', sha],
+                            stdout=subprocess.PIPE, stderr=DEVNULL)
+
 
+def git_object_kind(obj):
+    """
+    Return the git type of an encoded object.
+    """
     if obj.type == anchor_pb2.Object.COMMIT:
-        kind = 'commit'
+        return 'commit'
     elif obj.type == anchor_pb2.Object.TREE:
-        kind = 'tree'
+        return 'tree'
     elif obj.type == anchor_pb2.Object.BLOB:
-        kind = 'blob'
+        return 'blob'
     elif obj.type == anchor_pb2.Object.TAG:
-        kind = 'tag'
+        return 'tag'
+    raise Exception('unexpected object type: %s' % obj.type)
 
-    contents = obj.content
-    obj.size = obj.size
 
-    p = subprocess.Popen(['git', 'hash-object', '-w', '--stdin', '-t', kind],
-                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                         stderr=DEVNULL)
-    sha = p.communicate(obj.content)[0].decode('utf8').strip()
-    return sha
+def git_hash_object(kind, contents):
+    """
+    Return the hash git computes for an object of the given type and contents.
+    """
+    sha = hashlib.sha1(('%s %d\0' % (kind, len(contents))).encode('utf8'))
+    sha.update(contents)
+    return sha.hexdigest()
 
 
-def git_list_objects(ref, exclude):
+def git_decode_object(obj, pack):
     """
-    Return the objects reachable from ref excluding the objects reachable from
-    exclude.
+    Decode the object and write it to pack.
+
+    This operation is the inverse of `git_encode_object`.
+    """
+    pack.add(git_object_kind(obj), obj.content)
+
+
+def git_list_objects(refs, exclude, cat_file):
+    """
+    Return the objects reachable from any of refs excluding the objects
+    reachable from exclude.
+
+    Excludes that are not in the repository are skipped, checked in bulk
+    through cat_file, a shared `GitCatFile`.
     """
-    exclude = ['^%s' % obj for obj in exclude if git_object_exists(obj)]
-    objects = git_command_output('rev-list', '--objects', ref, *exclude)
+    missing = cat_file.missing(exclude)
+    exclude = ['^%s' % obj for obj in exclude if obj not in missing]
+    objects = git_command_output('rev-list', '--objects', *(list(refs) + exclude))
     if not objects:
         return []
     return [i.split()[0] for i in objects.split('\n')]
 
 
-def git_referenced_objects(sha):
+def git_pack_objects(refs, exclude, cat_file):
+    """
+    Return a process that writes a thin pack of the objects reachable from any
+    of refs excluding the objects reachable from exclude to its stdout.
+
+    Objects in the pack may be stored as deltas against excluded objects, which
+    are themselves left out of the pack.
+    """
+    missing = cat_file.missing(exclude)
+    revs = list(refs) + ['^%s' % obj for obj in exclude if obj not in missing]
+    p = subprocess.Popen(['git', 'pack-objects', '--stdout', '--revs', '--thin',
+                          '--delta-base-offset', '-q'],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=DEVNULL)
+    # the revisions are all read before the pack is written
+    p.stdin.write(''.join('%s\n' % rev for rev in revs).encode('utf8'))
+    p.stdin.close()
+    return p
+
+
+def git_index_pack(stream):
+    """
+    Write a pack read from a file object, completing it if it is thin, and
+    return a tuple (pack hash, size in bytes).
+
+    The pack is copied to git as it is read, so it is never held in memory as
+    a whole.
+    """
+    p = subprocess.Popen(['git', 'index-pack', '--stdin', '--fix-thin'],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=DEVNULL)
+    size = 0
+    try:
+        while True:
+            data = stream.read(PACK_READ_SIZE)
+            if not data:
+                break
+            p.stdin.write(data)
+            size += len(data)
+    except BrokenPipeError:
+        # git stops reading a pack it cannot index, its exit status tells
+        pass
+    finally:
+        # git only exits once its input is closed, also when the download fails
+        try:
+            p.stdin.close()
+        except BrokenPipeError:
+            pass
+        output = p.stdout.read()
+        p.wait()
+    if p.returncode != 0:
+        raise Exception('git index-pack failed')
+    return output.decode('utf8').split()[-1], size
+
+
+def git_referenced_objects(kind, contents):
     """
-    Return the objects directly referenced by the object.
+    Return the objects directly referenced by an object, parsed from its raw
+    contents.
     """
-    kind = git_object_type(sha)
     if kind == 'blob':
         # blob objects do not reference any other objects
         return []
-    data = git_object_data(sha).decode('utf8').strip()
-    if kind == 'tag':
+    elif kind == 'tag':
         # tag objects reference a single object
-        obj = data.split('\n')[0].split()[1]
-        return [obj]
+        obj = contents[:contents.index(b'\n')].split()[1]
+        return [obj.decode('ascii')]
     elif kind == 'commit':
-        # commit objects reference a tree and zero or more parents
-        lines = data.split('\n')
-        tree = lines[0].split()[1]
-        objs = [tree]
-        for line in lines[1:]:
-            if line.startswith('parent '):
-                objs.append(line.split()[1])
-            else:
-                break
-        return objs
+        # commit objects reference a tree and zero or more parents, which come
+        # first in the header
+        objs = []
+        start = 0
+        while True:
+            end = contents.index(b'\n', start)
+            line = contents[start:end]
+            if not line.startswith(b'tree ') and not line.startswith(b'parent '):
+                return objs
+            objs.append(line.split()[1].decode('ascii'))
+            start = end + 1
     elif kind == 'tree':
-        # tree objects reference zero or more trees and blobs, or submodules
-        lines = data.split('\n')
-        # submodules have the mode '160000' and the kind 'commit', we filter them out because
-        # there is nothing to download and this causes errors
-        return [line.split()[2] for line in lines if not line.startswith('160000 commit ')]
+        # tree objects reference zero or more trees and blobs, or submodules,
+        # as a sequence of '<mode> <name>\0<20 byte sha>' entries
+        objs = []
+        start = 0
+        while start < len(contents):
+            space = contents.index(b' ', start)
+            end = contents.index(b'\0', space) + 21
+            # submodules have the mode '160000', we filter them out because
+            # there is nothing to download and this causes errors
+            if contents[start:space] != b'160000':
+                objs.append(binascii.hexlify(contents[end - 20:end]).decode('ascii'))
+            start = end
+        return objs
     else:
         raise Exception('unexpected git object type: %s' % kind)
 
@@ -264,6 +362,217 @@ def git_symbolic_ref(name):
     """
     return git_command_output('symbolic-ref', name)
 
+def ipfs_multihash(ipfs_hash):
+    """
+    Return the raw multihash of a base58 ipfs hash.
+    """
+    return base58.b58decode(ipfs_hash)
+
+def ipfs_hash(reference):
+    """
+    Return the base58 ipfs hash of a blob reference, which is either the ipfs
+    hash itself or, in version 2 anchors, its raw multihash.
+    """
+    if len(reference) == 34 and reference[:2] == b'\x12 ':
+        return base58.b58encode(reference)
+    return reference.decode('utf8')
+
+def push_gas_limit(refs):
+    """
+    Return the gas limit of a push or pushMany transaction updating the given
+    refs, which grows with the length of their names, as the contract stores
+    new names and logs them.
+    """
+    gas_limit = PUSH_GAS_LIMIT
+    for ref in refs:
+        size = len(ref.encode('utf8'))
+        gas_limit += PUSH_REF_GAS_LIMIT + PUSH_REF_BYTE_GAS_LIMIT * size
+        if size >= 32:
+            # longer names take a storage word for every 32 bytes
+            gas_limit += PUSH_REF_WORD_GAS_LIMIT * ((size + 31) // 32)
+    return gas_limit
+
+class GitCatFile(object):
+    """
+    Long-lived `git cat-file --batch` and `--batch-check` processes.
+
+    Each process is started on first use and shared by all threads. Requests
+    to a process are serialized with a lock, so every request is paired with
+    its own response on the pipe.
+    """
+
+    def __init__(self):
+        self._batch = None
+        self._batch_check = None
+        self._batch_lock = threading.Lock()
+        self._batch_check_lock = threading.Lock()
+
+    def _start(self, mode):
+        """
+        Start a `git cat-file` process in the given batch mode.
+        """
+        return subprocess.Popen(['git', 'cat-file', mode],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=DEVNULL)
+
+    def _request(self, proc, sha):
+        """
+        Write a request for sha and return the parsed response header.
+
+        Return a tuple (kind, size), or None if the object is missing.
+        """
+        self._write(proc, ('%s\n' % sha).encode('utf8'))
+        header = proc.stdout.readline().decode('utf8').split()
+        if len(header) != 3:
+            # '<sha> missing' or '<sha> ambiguous'
+            return None
+        return header[1], int(header[2])
+
+    def _write(self, proc, data):
+        """
+        Write data to the process and flush it.
+        """
+        proc.stdin.write(data)
+        proc.stdin.flush()
+
+    def _check_process(self):
+        """
+        Return the `--batch-check` process, starting it if needed.
+
+        The caller must hold the batch check lock.
+        """
+        if self._batch_check is None:
+            self._batch_check = self._start('--batch-check')
+        return self._batch_check
+
+    def info(self, sha):
+        """
+        Return a tuple (kind, size) for the object, or None if it is missing.
+        """
+        with self._batch_check_lock:
+            return self._request(self._check_process(), sha)
+
+    def missing(self, shas):
+        """
+        Return the set of objects in shas that are missing from the repository.
+
+        Objects are checked BATCH_SIZE at a time, with each batch written to the
+        pipe in one go rather than waiting for a response per object.
+        """
+        shas = list(shas)
+        missing = set()
+        with self._batch_check_lock:
+            proc = self._check_process()
+            for i in range(0, len(shas), BATCH_SIZE):
+                batch = shas[i:i + BATCH_SIZE]
+                data = ''.join('%s\n' % sha for sha in batch).encode('utf8')
+                # write from another thread, otherwise git can block on a full
+                # output pipe while we are still blocked writing the request
+                writer = threading.Thread(target=self._write, args=(proc, data))
+                writer.start()
+                for sha in batch:
+                    if len(proc.stdout.readline().split()) != 3:
+                        missing.add(sha)
+                writer.join()
+        return missing
+
+    def read(self, sha):
+        """
+        Return a tuple (kind, size, contents) for the object.
+
+        The type, size and contents all come from a single streamed response.
+        """
+        with self._batch_lock:
+            if self._batch is None:
+                self._batch = self._start('--batch')
+            header = self._request(self._batch, sha)
+            if header is None:
+                raise Exception('object not found: %s' % sha)
+            kind, size = header
+            contents = self._batch.stdout.read(size)
+            self._batch.stdout.read(1)  # trailing newline
+        return kind, size, contents
+
+    def close(self):
+        """
+        Terminate the running processes.
+        """
+        for proc in (self._batch, self._batch_check):
+            if proc is not None:
+                proc.stdin.close()
+                proc.wait()
+        self._batch = self._batch_check = None
+
+
+class GitPackWriter(object):
+    """
+    A packfile streamed into `git index-pack --stdin`.
+
+    Objects are stored whole, without deltas, in the order they are added. The
+    number of objects has to be known up front because it is part of the pack
+    header. Objects only become visible to git once the pack is closed and
+    indexed.
+    """
+
+    TYPES = {'commit': 1, 'tree': 2, 'blob': 3, 'tag': 4}
+
+    def __init__(self, count):
+        self._count = count
+        self._added = 0
+        self._lock = threading.Lock()
+        self._checksum = hashlib.sha1()
+        self._proc = subprocess.Popen(['git', 'index-pack', '--stdin'],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=DEVNULL)
+        self._write(struct.pack('>4sII', b'PACK', 2, count))
+
+    def _write(self, data):
+        """
+        Write data to the pack, updating the trailing checksum.
+
+        The caller must hold the lock, except during initialization.
+        """
+        self._checksum.update(data)
+        self._proc.stdin.write(data)
+
+    def add(self, kind, contents):
+        """
+        Add an object to the pack.
+        """
+        # the entry header holds the type and a variable-length size
+        size = len(contents)
+        byte = (self.TYPES[kind] << 4) | (size & 0x0f)
+        size >>= 4
+        header = bytearray()
+        while size:
+            header.append(byte | 0x80)
+            byte = size & 0x7f
+            size >>= 7
+        header.append(byte)
+        data = zlib.compress(contents)
+
+        with self._lock:
+            if self._added == self._count:
+                raise Exception('too many objects for pack')
+            self._write(bytes(header))
+            self._write(data)
+            self._added += 1
+
+    def close(self):
+        """
+        Finish the pack, wait for git to index it, and return the pack hash.
+        """
+        with self._lock:
+            if self._added != self._count:
+                raise Exception('pack has %d of %d objects' % (self._added, self._count))
+            self._proc.stdin.write(self._checksum.digest())
+            self._proc.stdin.close()
+            output = self._proc.stdout.read().decode('utf8')
+            if self._proc.wait() != 0:
+                raise Exception('git index-pack failed')
+        return output.split()[-1]
+
+
 class Level(object):
     """
     A class for severity levels.
@@ -286,9 +595,18 @@ class Poison(object):
         self.message = message
 
 class Object(object):
-    def __init__(self, sha, proto):
+    """
+    A work item of the fetch queue: an object to download, holding the
+    serialized `anchor_pb2.Object` read from its anchor file.
+    """
+
+    __slots__ = ('sha', 'proto', 'pack', 'references')
+
+    def __init__(self, sha, proto, pack=None):
         self.sha = sha
         self.proto = proto
+        self.pack = pack  # the pack the object is written to once downloaded
+        self.references = []  # filled in once the object is downloaded
 
 class Binder(object):
     """
@@ -345,8 +663,29 @@ class Helper(object):
         self._address = address
         self._processes = processes
         self._verbosity = Level.INFO  # default verbosity
-        self._refs = {}  # map from remote ref name => (rev number, sha)
+        self._refs = {}  # map from remote ref name => sha
+        self._head = None  # remote head ref name, read along with the refs
+        self._anchors = {}  # map from sha => anchor content address, read along with the refs
+        self._push_many = False  # whether the contract has pushMany, which came with getState
         self._pushed = {}  # map from remote ref name => sha
+        self._cat_file = GitCatFile()  # shared by all upload threads
+        self._hash_processes = int(client.config.attributes.get('hash_processes', 0))
+        self._hash_pool = None  # started by the first fetch if hash_processes is set
+        self._anchor_format = client.config.attributes.get('anchor_format', 'objects')
+        # version 1 anchors can be read by clients predating version 2
+        self._anchor_version = int(client.config.attributes.get('anchor_version', 2))
+        # blobs of at least chunk_threshold bytes are split into chunks, 0 disables
+        self._chunk_threshold = int(client.config.attributes.get('chunk_threshold', 0))
+        self._chunker = Chunker()
+        # codec anchors and blobs are compressed with on push, see utils.codec
+        codec = client.config.attributes.get('codec', 'none')
+        if codec != 'none' and codec not in CODECS:
+            self._fatal('unknown codec %s' % codec)
+        self._codec = anchor_pb2.Object.Codec.Value(codec.upper())
+        self._anchor_cache = None  # created on first use
+        self._anchor_cache_lock = threading.Lock()
+        self._object_index = None  # created on first use
+        self._object_index_lock = threading.Lock()
 
     @property
     def verbosity(self):
@@ -388,8 +727,32 @@ class Helper(object):
     def _connection(self):
         """
         Return a ipfs connection object.
+
+        The connection is safe to share between threads.
+        """
+        return client.ipfs
+
+    def _cache(self):
+        """
+        Return the cache of anchors stored in the repository's git directory.
+        """
+        with self._anchor_cache_lock:
+            if self._anchor_cache is None:
+                path = os.path.join(git_dir(), 'lly', 'anchors')
+                size = int(client.config.attributes.get('anchor_cache_size', ANCHOR_CACHE_SIZE))
+                self._anchor_cache = AnchorCache(path, size)
+        return self._anchor_cache
+
+    def _index(self):
+        """
+        Return the index of the ipfs hashes objects are stored at, kept in the
+        repository's git directory.
         """
-        return client.ipfs.connection
+        with self._object_index_lock:
+            if self._object_index is None:
+                path = os.path.join(git_dir(), 'lly', 'objects.db')
+                self._object_index = ObjectIndex(path)
+        return self._object_index
 
     def run(self):
         """
@@ -415,6 +778,14 @@ class Helper(object):
                 break
             else:
                 self._fatal('unsupported operation: %s' % line)
+        if self._hash_pool is not None:
+            # stop the workers before git cat-file, which only exits once
+            # every copy of its input pipe is closed
+            self._hash_pool.terminate()
+            self._hash_pool.join()
+        self._cat_file.close()
+        if self._object_index is not None:
+            self._object_index.close()
 
     def _do_option(self, line):
         """
@@ -447,15 +818,19 @@ class Helper(object):
         """
         Handle the push command.
         """
+        # push the refs of the whole batch at once
+        pushes = []
         while True:
             src, dst = line.split(' ')[1].split(':')
             if src == '':
                 self._delete(dst)
             else:
-                self._push(src, dst)
+                pushes.append((src, dst))
             line = readline()
             if line == '':
                 break
+        if pushes:
+            self._push(pushes)
         self._write()
 
     def _read_sym_ref(self, path):
@@ -463,9 +838,17 @@ class Helper(object):
         Return the symbolic ref from the remote or None if not found
         """
 
+        if path == 'HEAD' and self._head is not None:
+            # already read when listing the refs
+            return self._head
+
         self._trace('fetching symbolic ref')
-        response = client.repo.call(self._address, 'getHead', [])
-        if 'result' in response:
+        try:
+            response = client.repo.call(self._address, 'getHead', [])
+        except RPCError as e:
+            self._trace('cannot read the head ref: %s' % e)
+            return None
+        if response['result']:
             return response['result'][0].decode('utf-8')
 
         return None
@@ -474,12 +857,15 @@ class Helper(object):
         """
         Handle the fetch command.
         """
+        # fetch the objects of the whole batch in a single download session
+        shas = []
         while True:
             _, sha, value = line.split(' ')
-            self._fetch(sha)
+            shas.append(sha)
             line = readline()
             if line == '':
                 break
+        self._fetch(shas)
         self._write()
 
     def _delete(self, ref):
@@ -497,20 +883,32 @@ class Helper(object):
         # self._pushed.pop(ref, None)  # discard
         self._write('ok %s' % ref)
 
-    def _push(self, src, dst):
+    def _push(self, pushes):
         """
-        Push src to dst on the remote.
+        Push each src to its dst on the remote, given as (src, dst) pairs.
+
+        The objects of the whole batch are uploaded once, to a single anchor,
+        and the refs are updated in a single pushMany transaction.
         """
+        # contracts predating pushMany get a push transaction per ref
+        batched = len(pushes) > 1 and self._push_many
+        if batched:
+            gas_limits = [push_gas_limit([dst for _, dst in pushes])]
+        else:
+            gas_limits = [push_gas_limit([dst]) for _, dst in pushes]
+        transactions = len(gas_limits)
         default_gas_price = int(int(client.config.attributes['default_gas_price']) / denoms.gwei)
-        default_gas_limit = 200000
-        max_gas_gwei = default_gas_price * default_gas_limit
-        max_gas_usd = float(current_price()["bid"]) * (max_gas_gwei / denoms.gwei)
+        default_gas_limit = max(gas_limits)
+        max_gas_gwei = default_gas_price * sum(gas_limits)
+        max_gas_usd = float(current_price(client.infura)["bid"]) * (max_gas_gwei / denoms.gwei)
 
         self._trace("\nCreating push transaction:\n", level=Level.INFO, exact=True)
 
         self._trace("\nUsing:", level=Level.INFO, exact=True)
         self._trace("\n\tGas price: %dgwei" % default_gas_price, level=Level.INFO, exact=True)
         self._trace("\n\tGas limit: %dgwei" % default_gas_limit, level=Level.INFO, exact=True)
+        if transactions > 1:
+            self._trace("\n\tTransactions: %d" % transactions, level=Level.INFO, exact=True)
         self._trace("\n\tMax price: %dgwei ($%s)\n\n" % (max_gas_gwei, '{0:.{1}f}'.format(max_gas_usd, 2)), level=Level.INFO, exact=True)
 
         delay = 5
@@ -521,16 +919,91 @@ class Helper(object):
             time.sleep(1)
         self._trace("\r\tCommitting...          \n\n", level=Level.INFO, exact=True)
 
-        anchor = anchor_pb2.Anchor()
-        force = False
-        if src.startswith('+'):
-            src = src[1:]
-            force = True
-        present = [self._refs[name][1] for name in self._refs]
-        present.extend(self._pushed.values())
-
-        # before updating the ref, write all objects that are referenced
-        objects = git_list_objects(src, present)
+        srcs = []
+        for src, dst in pushes:
+            if src.startswith('+'):
+                src = src[1:]
+            srcs.append(src)
+        shas = [git_ref_value(src) for src in srcs]
+
+        # commits pushed before keep the anchor they were pushed with, a new
+        # anchor would leave out the objects already on the remote
+        try:
+            anchored = self._resolve_anchors(shas)
+        except RPCError as e:
+            self._fatal('cannot resolve anchors: %s' % e)
+        content_addresses = [base58.b58encode(b'\x12 ' + content_address)
+                             if any(bytearray(content_address)) else None
+                             for content_address in anchored]
+
+        if None in content_addresses:
+            anchor = anchor_pb2.Anchor()
+            tips = self._base_tips(srcs, [dst for _, dst in pushes])
+
+            # before updating the refs, write all objects that are referenced
+            if self._anchor_format == 'pack':
+                self._put_pack(anchor, srcs, tips)
+            else:
+                objects = self._put_objects(srcs, tips)
+                if len(objects) > PAGE_SIZE:
+                    self._put_pages(anchor, objects)
+                else:
+                    self._set_objects(anchor, objects)
+
+            # link the anchors of the tips, which hold the objects this anchor
+            # leaves out
+            if tips:
+                anchor.prev_anchor = tips[0]
+                anchor.prev_anchors.extend(tips[1:])
+            content_address = self._put_anchor(anchor)
+            content_addresses = [address or content_address for address in content_addresses]
+
+        updates = [(sha, dst, content_address)
+                   for sha, (_, dst), content_address in zip(shas, pushes, content_addresses)]
+        if batched:
+            errors = [self._write_refs(updates, default_gas_price, gas_limits[0])] * len(updates)
+        else:
+            errors = [self._write_ref(content_address, sha, dst, default_gas_price, gas_limit)
+                      for (sha, dst, content_address), gas_limit in zip(updates, gas_limits)]
+        for (sha, dst, content_address), error in zip(updates, errors):
+            if error is None:
+                self._write('ok %s' % dst)
+                self._pushed[dst] = sha
+                self._anchors[sha] = base58.b58decode(content_address)[2:]
+            else:
+                self._write('error %s %s' % (dst, error))
+
+    def _base_tips(self, srcs, dsts):
+        """
+        Return the remote tips present locally that share history with any of
+        srcs, the tips replaced at dsts first.
+
+        A push leaves out the objects reachable from these tips and its anchor
+        links their anchors, so every object it leaves out can be fetched
+        through it.
+        """
+        tips = []
+        for dst in dsts:
+            tip = self._pushed.get(dst, self._refs.get(dst))
+            if tip is not None and tip not in tips:
+                tips.append(tip)
+        for tip in list(self._pushed.values()) + list(self._refs.values()):
+            if tip not in tips:
+                tips.append(tip)
+        missing = self._cat_file.missing(tips)
+        # with several commits, merge-base finds the common ancestors of the
+        # first and any of the others
+        return [tip for tip in tips
+                if tip not in missing and git_command_ok('merge-base', tip, *srcs)]
+
+
+    def _put_objects(self, srcs, present):
+        """
+        Upload the objects reachable from any of srcs and not from present, and
+        return a map from hash to `anchor_pb2.Object` of them.
+        """
+        objects = git_list_objects(srcs, present, self._cat_file)
+        uploaded = {}
         try:
             # upload objects in parallel
             pool = multiprocessing.pool.ThreadPool(processes=self._processes)
@@ -540,7 +1013,7 @@ class Helper(object):
             self._trace('', level=Level.INFO, exact=True)
             for done, item in enumerate(res, 1):
                 git_hash, obj = item
-                anchor.objects[git_hash].CopyFrom(obj)
+                uploaded[git_hash] = obj
 
                 pct = float(done) / total
                 message = '\rWriting objects: {:4.0%} ({}/{})'.format(pct, done, total)
@@ -552,19 +1025,74 @@ class Helper(object):
                 raise # re-raise exception so it prints out a stack trace
             else:
                 self._fatal('exception while writing objects (run with -v for details)\n')
+        return uploaded
+
+    def _set_objects(self, anchor, objects):
+        """
+        Add objects, a map from hash to `anchor_pb2.Object`, to the anchor.
 
-        prev_anchor_hash = git_ref_value(src + "^1")
-        anchor.prev_anchor = prev_anchor_hash
-        content_address = self._connection().add_bytes(anchor.SerializeToString())
+        Version 2 anchors hold the objects as entries sorted by hash, keyed by
+        binary hashes and referencing blobs by raw multihashes.
+        """
+        if self._anchor_version < 2:
+            for sha, obj in objects.items():
+                anchor.objects[sha].CopyFrom(obj)
+            return
 
-        sha = git_ref_value(src)
-        error = self._write_ref(content_address, sha, dst, default_gas_price, default_gas_limit, force)
-        if error is None:
-            self._write('ok %s' % dst)
-            self._pushed[dst] = sha
-        else:
-            self._write('error %s %s' % (dst, error))
+        anchor.version = 2
+        for sha in sorted(objects):
+            entry = anchor.entries.add()
+            entry.sha = binascii.unhexlify(sha)
+            entry.object.CopyFrom(objects[sha])
+            if entry.object.type == anchor_pb2.Object.BLOB:
+                if entry.object.chunks:
+                    chunks = [ipfs_multihash(chunk.decode('utf8')) for chunk in entry.object.chunks]
+                    entry.object.ClearField('chunks')
+                    entry.object.chunks.extend(chunks)
+                else:
+                    entry.object.content = ipfs_multihash(entry.object.content.decode('utf8'))
 
+    def _put_pages(self, anchor, objects):
+        """
+        Split objects into pages of PAGE_SIZE objects by hash, upload each page
+        separately, and link them from the anchor.
+        """
+        shas = sorted(objects)
+        pages = []
+        for i in range(0, len(shas), PAGE_SIZE):
+            page = anchor_pb2.Anchor()
+            self._set_objects(page, dict((sha, objects[sha]) for sha in shas[i:i + PAGE_SIZE]))
+            pages.append(page)
+        pool = multiprocessing.pool.ThreadPool(processes=self._processes)
+        hashes = pool.map(Binder(self, '_put_anchor'), pages)
+        pool.close()
+        for i, page_hash in enumerate(hashes):
+            link = anchor.pages.add()
+            link.first = shas[i * PAGE_SIZE]
+            link.hash = page_hash
+
+    def _put_pack(self, anchor, srcs, present):
+        """
+        Upload the objects reachable from any of srcs and not from present as a
+        single thin pack, delta-compressed against present, and link it from
+        the anchor.
+        """
+        try:
+            # stream the pack to ipfs as it is written
+            p = git_pack_objects(srcs, present, self._cat_file)
+            self._trace('', level=Level.INFO, exact=True)
+            try:
+                anchor.pack = self._connection().add_stream(p.stdout)
+            finally:
+                p.stdout.close()
+            if p.wait() != 0:
+                raise Exception('git pack-objects failed')
+            self._trace('\rWriting objects: done.\n', level=Level.INFO, exact=True)
+        except Exception:
+            if self.verbosity >= Level.DEBUG:
+                raise # re-raise exception so it prints out a stack trace
+            else:
+                self._fatal('exception while writing objects (run with -v for details)\n')
 
     def _ref_path(self, name):
         """
@@ -595,21 +1123,53 @@ class Helper(object):
 
         Return a tuple (revision, content).
         """
-        return self._connection().cat(obj.content)
+        return self._connection().cat(ipfs_hash(obj.content))
 
     def _put_object(self, sha):
         """
         Upload an object to the remote.
         """
-        obj, data = git_encode_object(sha)
+        # blobs stored by an earlier push or fetch do not need to be uploaded
+        entry = self._index().get(sha)
+        if entry is not None:
+            content_address, codec = entry
+            _, size = self._cat_file.info(sha)
+            obj = anchor_pb2.Object()
+            obj.type = anchor_pb2.Object.BLOB
+            obj.content = str.encode(content_address)
+            obj.size = size
+            obj.codec = codec
+            return [sha, obj]
+
+        kind, size = self._cat_file.info(sha)
+        chunked = kind == 'blob' and 0 < self._chunk_threshold <= size
+        if chunked or (kind == 'blob' and size >= STREAM_THRESHOLD):
+            # large blobs are piped from git to ipfs without being read into
+            # memory as a whole
+            obj = anchor_pb2.Object()
+            obj.type = anchor_pb2.Object.BLOB
+            obj.size = size
+            data = None
+        else:
+            obj, data = git_encode_object(sha, self._cat_file)
 
         retries = 0
         while True:
             try:
                 # Upload blobs to ipfs and set content to ipfs hash
                 if obj.type == anchor_pb2.Object.BLOB:
-                    content_address = self._connection().add_bytes(data)
+                    obj.codec = self._codec
+                if chunked:
+                    obj.ClearField('chunks')
+                    obj.chunks.extend(str.encode(content_address)
+                                      for content_address in self._put_chunks(sha))
+                elif obj.type == anchor_pb2.Object.BLOB:
+                    if data is None:
+                        content_address = self._put_stream(sha)
+                    else:
+                        content_address = self._connection().add_bytes(self._compress(data))
                     obj.content = str.encode(content_address)
+                    self._index().put(sha, content_address, obj.codec)
 
                 return [sha, obj]
             except Exception as e:
@@ -623,9 +1183,100 @@ class Helper(object):
             else:
                 break
 
+    def _put_stream(self, sha):
+        """
+        Stream the contents of a blob from git to ipfs and return the ipfs hash.
+        """
+        p = git_blob_stream(sha)
+        try:
+            stream = p.stdout
+            if self._codec != anchor_pb2.Object.NONE:
+                stream = self._codec_of(self._codec).compress_stream(stream)
+            content_address = self._connection().add_stream(stream)
+        finally:
+            p.stdout.close()
+            p.wait()
+        if p.returncode != 0:
+            raise Exception('git cat-file failed for %s' % sha)
+        return content_address
+
+    def _put_chunks(self, sha):
+        """
+        Split a blob into content-defined chunks, upload the chunks that are not
+        on ipfs yet as raw blocks, and return the ipfs hashes of all chunks.
+        """
+        content_addresses = []
+        p = git_blob_stream(sha)
+        try:
+            for chunk in self._chunker.split(p.stdout):
+                chunk = self._compress(chunk)
+                # the ipfs hash of a raw block is the multihash of its data
+                content_address = base58.b58encode(b'\x12 ' + hashlib.sha256(chunk).digest())
+                if not self._index().has_chunk(content_address):
+                    key = self._connection().block_put(chunk)
+                    if key != content_address:
+                        raise Exception('ipfs stored a chunk at %s instead of %s' % (key, content_address))
+                    self._index().put_chunk(content_address)
+                content_addresses.append(content_address)
+        finally:
+            p.stdout.close()
+            p.wait()
+        if p.returncode != 0:
+            raise Exception('git cat-file failed for %s' % sha)
+        return content_addresses
+
+    def _get_chunks(self, obj):
+        """
+        Return the content of a chunked blob, downloading its chunks in parallel.
+        """
+        content_addresses = [ipfs_hash(chunk) for chunk in obj.chunks]
+        get_chunk = lambda content_address: self._decompress(
+            obj.codec, self._connection().block_get(content_address))
+        pool = multiprocessing.pool.ThreadPool(processes=CHUNK_PREFETCH)
+        try:
+            return b''.join(pool.map(get_chunk, content_addresses))
+        finally:
+            pool.close()
+
+    def _codec_of(self, codec):
+        """
+        Return the `utils.codec.Codec` of an Object.Codec value.
+        """
+        return CODECS[anchor_pb2.Object.Codec.Name(codec).lower()]
+
+    def _compress(self, data):
+        """
+        Return data compressed with the codec configured for pushes.
+        """
+        if self._codec == anchor_pb2.Object.NONE:
+            return data
+        return self._codec_of(self._codec).compress(data)
+
+    def _decompress(self, codec, data):
+        """
+        Return data read from ipfs decompressed with the given codec.
+        """
+        if codec == anchor_pb2.Object.NONE:
+            return data
+        return self._codec_of(codec).decompress(data)
+
+    def _hash(self, obj):
+        """
+        Return the hash of a decoded object.
+
+        Large objects are hashed in the process pool when one is configured.
+        Otherwise hashing runs on the calling thread; hashlib releases the GIL
+        while it digests large buffers.
+        """
+        args = (git_object_kind(obj), obj.content)
+        if self._hash_pool is not None and len(obj.content) >= HASH_POOL_THRESHOLD:
+            return self._hash_pool.apply(git_hash_object, args)
+        return git_hash_object(*args)
+
     def _download(self, input_queue, output_queue):
         """
-        Download files given in input_queue and push results to output_queue.
+        Download files given in input_queue, write them to their pack and push
+        results to output_queue.
         """
         while True:
             try:
@@ -638,49 +1289,205 @@ class Helper(object):
                 obj_proto.ParseFromString(obj.proto)
 
                 # Fetch blobs
-                if obj_proto.type == anchor_pb2.Object.BLOB:
+                content_address = None
+                chunks = list(obj_proto.chunks)
+                if chunks:
+                    obj_proto.content = self._get_chunks(obj_proto)
+                elif obj_proto.type == anchor_pb2.Object.BLOB:
+                    content_address = ipfs_hash(obj_proto.content)
                     data = self._get_file(obj_proto)
-                    obj_proto.content = data
+                    obj_proto.content = self._decompress(obj_proto.codec, data)
 
-                computed_sha = git_decode_object(obj_proto)
+                # verify the object before it is written to the repository
+                computed_sha = self._hash(obj_proto)
                 if computed_sha != obj.sha:
                     output_queue.put(
                         Poison('hash mismatch %s != %s' % (computed_sha, obj.sha)))
+                    continue
+                git_decode_object(obj_proto, obj.pack)
+                if content_address is not None:
+                    self._index().put(obj.sha, content_address, obj_proto.codec)
+                for chunk in chunks:
+                    self._index().put_chunk(ipfs_hash(chunk))
+                obj.references = git_referenced_objects(git_object_kind(obj_proto),
+                                                        obj_proto.content)
                 output_queue.put(obj)
             except Exception as e:
                 output_queue.put(Poison('exception while downloading: %s' % e))
 
-    def _fetch(self, sha):
+    def _get_anchor(self, ipfs_hash):
         """
-        Recursively fetch the given object and the objects it references.
+        Return the `AnchorFile` of the anchor with the given ipfs hash.
+
+        Anchors are immutable, so they are downloaded and parsed at most once
+        and then read from the cache.
         """
-        # Get head ref
-        response = client.repo.call(self._address, 'getHead', [])
-        ref_head = response['result'][0].decode('utf-8')
+        anchor_file = self._cache().get(ipfs_hash)
+        if anchor_file is not None:
+            return anchor_file
+        # only the header is parsed, the objects are parsed when downloaded
+        header, objects = split_anchor(self._connection().cat(ipfs_hash))
+        anchor = anchor_pb2.Anchor()
+        anchor.ParseFromString(header)
+        if anchor.codec != anchor_pb2.Object.NONE:
+            header, objects = split_anchor(self._decompress(anchor.codec, anchor.payload))
+        return self._cache().put(ipfs_hash, header, objects)
 
-        # Get anchor for ref
-        response = client.repo.call(self._address, 'getRef', [ref_head])
-        ref_anchor = response['result'][0]
+    def _put_anchor(self, anchor):
+        """
+        Upload an anchor, keeping a copy in the cache, and return its ipfs hash.
 
-        response = client.repo.call(self._address, 'getAnchor', [ref_anchor])
-        content_address = response['result'][0]
-        ipfs_hash = base58.b58encode(b'\x12 ' + content_address)
-        self._trace("Fetching from: %s" % ipfs_hash)
-        anchor_bin = self._connection().cat(ipfs_hash)
+        With a codec configured, the anchor is compressed and wrapped in an
+        anchor holding just the codec and the compressed payload.
+        """
+        data = anchor.SerializeToString()
+        header, objects = split_anchor(data)
+        if self._codec != anchor_pb2.Object.NONE:
+            wrapper = anchor_pb2.Anchor()
+            wrapper.codec = self._codec
+            wrapper.payload = self._compress(data)
+            data = wrapper.SerializeToString()
+        ipfs_hash = self._connection().add_bytes(data)
+        self._cache().put(ipfs_hash, header, objects).close()
+        return ipfs_hash
+
+    def _anchor_pages(self, anchor):
+        """
+        Yield the anchor files of the pages holding the objects of an anchor
+        file, in order.
 
-        anchor = anchor_pb2.Anchor()
-        anchor.ParseFromString(anchor_bin)
+        An anchor that is not split into pages is its own single page. Pages are
+        downloaded in the background, at most PAGE_PREFETCH ahead of the page
+        being consumed, so only a bounded number of them is held in memory.
+        """
+        if not anchor.header.pages:
+            yield anchor
+            return
+        links = iter(anchor.header.pages)
+        pool = multiprocessing.pool.ThreadPool(processes=PAGE_PREFETCH)
+        prefetched = collections.deque()
+        try:
+            for link in itertools.islice(links, PAGE_PREFETCH):
+                prefetched.append(pool.apply_async(self._get_anchor, (link.hash,)))
+            while prefetched:
+                page = prefetched.popleft().get()
+                for link in itertools.islice(links, 1):
+                    prefetched.append(pool.apply_async(self._get_anchor, (link.hash,)))
+                yield page
+        finally:
+            pool.terminate()
+
+    def _resolve_anchors(self, shas):
+        """
+        Return the content addresses of the anchors pushed with the given
+        commits, all zero for commits pushed without one.
 
-        queue = []
-        for sha in anchor.objects:
-            proto = anchor.objects[sha]
-            queue.append(Object(sha, proto.SerializeToString()))
+        The anchors not read along with the refs are resolved in a single
+        batched request.
+        """
+        unknown = [sha for sha in shas if sha not in self._anchors]
+        if unknown:
+            calls = [('getAnchor', [decode_hex(sha)]) for sha in unknown]
+            responses = client.repo.call_many(self._address, calls)
+            for sha, response in zip(unknown, responses):
+                self._anchors[sha] = response['result'][0]
+        return [self._anchors[sha] for sha in shas]
+
+    def _prev_anchor_hashes(self, anchor):
+        """
+        Return the ipfs hashes of the anchors preceding the given anchor file,
+        leaving out those whose history is already present.
+        """
+        tips = [anchor.header.prev_anchor] + list(anchor.header.prev_anchors)
+        # an interrupted fetch can leave a tip present without its history
+        tips = [sha for sha in tips
+                if sha and (self._cat_file.info(sha) is None or not git_history_exists(sha))]
+        hashes = []
+        for content_address in self._resolve_anchors(tips):
+            if any(bytearray(content_address)):
+                hashes.append(base58.b58encode(b'\x12 ' + content_address))
+        return hashes
+
+    def _tip_anchors(self, shas):
+        """
+        Return the ipfs hashes of the anchors pushed with the given commits.
+        """
+        try:
+            content_addresses = self._resolve_anchors(shas)
+        except RPCError as e:
+            self._fatal('cannot resolve anchors: %s' % e)
+        hashes = []
+        for sha, content_address in zip(shas, content_addresses):
+            if not any(bytearray(content_address)):
+                self._fatal('no anchor for %s' % sha)
+            hashes.append(base58.b58encode(b'\x12 ' + content_address))
+        return hashes
+
+    def _walk_anchors(self, chains, output_queue):
+        """
+        Follow anchor chains, given as pairs of the ipfs hash the chain starts
+        at and an event, and push the anchor files of each chain to
+        output_queue, newest first, followed by a Poison.
 
-        # have multiple threads downloading in parallel
-        pending = set()
-        downloaded = set()
-        input_queue = multiprocessing.Queue()  # requesting downloads
-        output_queue = multiprocessing.Queue()  # completed downloads
+        An anchor pushed along with other refs links the anchors of all their
+        previous tips, so a chain branches there and is walked depth first.
+        The walk of a chain ends early once its event is set.
+        """
+        try:
+            for ipfs_hash, stop in chains:
+                pending = [ipfs_hash]
+                walked = set()
+                while pending and not stop.is_set():
+                    ipfs_hash = pending.pop()
+                    if ipfs_hash in walked:
+                        continue
+                    walked.add(ipfs_hash)
+                    self._trace("Fetching from: %s" % ipfs_hash)
+                    anchor = self._get_anchor(ipfs_hash)
+                    pending.extend(reversed(self._prev_anchor_hashes(anchor)))
+                    output_queue.put(anchor)
+                output_queue.put(Poison())
+        except Exception as e:
+            output_queue.put(Poison('exception while resolving anchors: %s' % e))
+
+    def _fetch(self, shas):
+        """
+        Recursively fetch the given objects and the objects they reference,
+        in a single download session.
+        """
+        wanted = []
+        for sha in shas:
+            if sha in wanted:
+                continue
+            if self._cat_file.info(sha) is not None and git_history_exists(sha):
+                self._trace('%s already downloaded' % sha)
+                continue
+            wanted.append(sha)
+        if not wanted:
+            return
+
+        if self._hash_processes and self._hash_pool is None:
+            # the workers are started from a fresh process rather than forked
+            # from this one, so they do not hold the pipes of git cat-file open
+            # or copy the state of running threads
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._hash_pool = context.Pool(processes=self._hash_processes)
+
+        # every wanted object is the tip of a ref, and each anchor only holds
+        # the objects pushed since the previous one of its ref, so follow the
+        # chain back from each tip, resolving anchors ahead in the background
+        chains = [(ipfs_hash, threading.Event()) for ipfs_hash in self._tip_anchors(wanted)]
+        anchor_queue = multiprocessing.dummy.Queue(ANCHOR_PREFETCH)
+        walker = multiprocessing.dummy.Process(target=Binder(self, '_walk_anchors'),
+                                               args=(chains, anchor_queue))
+        walker.daemon = True
+        walker.start()
+
+        # have multiple threads downloading in parallel; they are threads, so
+        # use thread queues, which pass work items by reference
+        input_queue = multiprocessing.dummy.Queue()  # requesting downloads
+        output_queue = multiprocessing.dummy.Queue()  # completed downloads
         procs = []
         for _ in range(self._processes):
             target = Binder(self, '_download')
@@ -691,33 +1498,98 @@ class Helper(object):
             proc.start()
             procs.append(proc)
         self._trace('', level=Level.INFO, exact=True) # for showing progress
-        done = total = 0
+        received = 0
+        unresolved = set()  # referenced objects that have not been downloaded
+        for sha, (_, stop) in zip(wanted, chains):
+            # the tip itself may be held by an anchor further down the chain
+            unresolved.add(sha)
+            packs = []  # pack anchors, which are indexed oldest first
+            while True:
+                anchor = anchor_queue.get()
+                if isinstance(anchor, Poison):
+                    if anchor.message is not None:
+                        self._fatal(anchor.message)
+                    break
+                if anchor.header.pack:
+                    packs.append(anchor.header)
+                    anchor.close()
+                    continue
+                for page in self._anchor_pages(anchor):
+                    received = self._fetch_page(page, input_queue, output_queue, received, unresolved)
+                    page.close()
+                    # objects referenced from other pages or anchors are resolved
+                    # once those are indexed
+                    unresolved = self._cat_file.missing(unresolved)
+                if not unresolved and not packs and git_history_exists(sha):
+                    # everything the fetched objects reference is present
+                    stop.set()
+                    while not isinstance(anchor_queue.get(), Poison):
+                        pass
+                    break
+
+            # thin packs are deltified against the packs before them
+            self._fetch_packs(list(reversed(packs)))
+            unresolved = self._cat_file.missing(unresolved)
+        self._trace('\rReceiving objects: 100% ({}/{}), done.\n'.format(received, received),
+                    level=Level.INFO, exact=True)
+        for proc in procs:
+            input_queue.put(Poison())
+        for proc in procs:
+            proc.join()
+
+        # anything referenced from outside the chains has to be present already
+        if unresolved:
+            self._fatal('incomplete history, missing %d objects including %s' %
+                        (len(unresolved), next(iter(unresolved))))
+        # a broken chain must not pass for a successful fetch
+        missing = self._cat_file.missing(wanted)
+        if missing:
+            self._fatal('anchors do not hold %d of the fetched objects, including %s' %
+                        (len(missing), next(iter(missing))))
+        for sha, (_, stop) in zip(wanted, chains):
+            if not stop.is_set() and not git_history_exists(sha):
+                self._fatal('incomplete history of %s' % sha)
+
+    def _fetch_page(self, anchor, input_queue, output_queue, received, unresolved):
+        """
+        Download the missing objects of the anchor file of a page into a single
+        pack.
+
+        Objects the page references but does not hold are added to unresolved.
+        Return the number of objects received so far.
+        """
+        # only the objects that are missing locally need to be downloaded
+        missing = self._cat_file.missing(anchor)
+
+        # objects left by an interrupted fetch are present, but their history
+        # may not be, so what they reference is resolved like the rest
+        for sha in anchor:
+            if sha in missing:
+                continue
+            obj_proto = anchor_pb2.Object()
+            obj_proto.ParseFromString(anchor[sha])
+            if obj_proto.type != anchor_pb2.Object.BLOB:
+                references = git_referenced_objects(git_object_kind(obj_proto), obj_proto.content)
+                unresolved.update(ref for ref in references if ref not in anchor)
+        if not missing:
+            return received
+
+        # downloaded objects are streamed into a single pack
+        pack = GitPackWriter(len(missing))
+        queue = []
+        for sha in missing:
+            queue.append(Object(sha, anchor[sha], pack))
+
+        pending = set()
+        downloaded = set()
         while queue or pending:
             if queue:
                 # if possible, queue up download
                 obj = queue.pop()
-                sha = obj.sha
-
-                if sha in downloaded or sha in pending:
+                if obj.sha in downloaded or obj.sha in pending:
                     continue
-                if git_object_exists(sha):
-                    if not git_history_exists(sha):
-                        # this can only happen in the case of aborted fetches
-                        # that are resumed later
-                        self._trace('missing part of history from %s' % sha)
-
-                        referenced_objects = []
-                        for referenced_object in git_referenced_objects(res.sha):
-                            sha = referenced_object
-                            proto = anchor.objects[referenced_object]
-                            referenced_objects.append(Object(sha, proto))
-
-                        queue.extend(git_referenced_objects(sha))
-                    else:
-                        self._trace('%s already downloaded' % sha)
-                else:
-                    pending.add(sha)
-                    input_queue.put(obj)
+                pending.add(obj.sha)
+                input_queue.put(obj)
             else:
                 # process completed download
                 res = output_queue.get()
@@ -725,26 +1597,49 @@ class Helper(object):
                     self._fatal(res.message)
                 pending.remove(res.sha)
                 downloaded.add(res.sha)
-
-                referenced_objects = []
-                for referenced_object in git_referenced_objects(res.sha):
-                    sha = referenced_object
-                    proto = anchor.objects[referenced_object]
-                    referenced_objects.append(Object(sha, proto))
+                unresolved.update(sha for sha in res.references if sha not in anchor)
 
                 # show progress
-                done = len(downloaded)
+                done = received + len(downloaded)
                 total = done + len(pending)
                 pct = float(done) / total
                 message = '\rReceiving objects: {:4.0%} ({}/{})'.format(pct, done, total)
 
                 self._trace(message, level=Level.INFO, exact=True)
-        self._trace('\rReceiving objects: 100% ({}/{}), done.\n'.format(done, total),
-                    level=Level.INFO, exact=True)
-        for proc in procs:
-            input_queue.put(Poison())
-        for proc in procs:
-            proc.join()
+
+        # the objects are only usable once the pack has been indexed
+        self._trace('indexing pack %s' % pack.close())
+        return received + len(downloaded)
+
+    def _fetch_packs(self, anchors):
+        """
+        Fetch the objects of anchors that hold them in packs, oldest first.
+
+        The packs are thin, so the objects they are delta-compressed against
+        have to be present already. Where the anchors of several tips were
+        walked the order is not strict, so packs that fail to index are
+        indexed again once the others are. Each pack is streamed from ipfs
+        into git, and downloaded again when it is retried rather than held in
+        memory in between.
+        """
+        pending = anchors
+        while pending:
+            failed = []
+            for anchor in pending:
+                self._trace('', level=Level.INFO, exact=True)
+                try:
+                    with self._connection().cat_stream(anchor.pack) as stream:
+                        pack, size = git_index_pack(stream)
+                except Exception as e:
+                    failed.append((anchor, e))
+                    continue
+                self._trace('\rReceiving objects: {} bytes, done.\n'.format(size),
+                            level=Level.INFO, exact=True)
+                self._trace('indexing pack %s' % pack)
+            if len(failed) == len(pending):
+                anchor, e = failed[0]
+                self._fatal('cannot index the pack %s: %s' % (anchor.pack, e))
+            pending = [anchor for anchor, _ in failed]
 
     def _write_ref(self, content_address, new_sha, ref, gasprice, gaslimit, force=False):
         """
@@ -771,30 +1666,77 @@ class Helper(object):
         self._trace("ref hash: %s" % ref)
         self._trace("content address: %s" % content_address)
 
-        response = client.repo.transact(self._address, 'push', [ref, decode_hex(new_sha), base58.b58decode(content_address)[2:]], gasprice=gasprice, gaslimit=gaslimit)
-        if 'result' in response:
-            txn_hash = response['result']
-            self._trace("Transaction: %s\n" % txn_hash, level=Level.INFO, exact=True)
-        else:
-            self._trace(response)
+        try:
+            response = client.repo.transact(self._address, 'push', [ref, decode_hex(new_sha), base58.b58decode(content_address)[2:]], gasprice=gasprice, gaslimit=gaslimit)
+        except RPCError as e:
+            return 'push transaction failed: %s' % e
+        txn_hash = response['result']
+        self._trace("Transaction: %s\n" % txn_hash, level=Level.INFO, exact=True)
+
+    def _write_refs(self, updates, gasprice, gaslimit):
+        """
+        Update the given refs, as (new sha, ref, anchor content address)
+        triples, in a single transaction.
+
+        Return None if there is no error, otherwise return a description of the
+        error.
+        """
+        self._trace('writing %d refs to %s' % (len(updates), self._address))
+
+        # the contract takes the ref names like getState returns them
+        names = ''.join('%s\n' % ref for _, ref, _ in updates).encode('utf8')
+        hashes = [decode_hex(sha) for sha, _, _ in updates]
+        anchors = [base58.b58decode(content_address)[2:] for _, _, content_address in updates]
+        try:
+            response = client.repo.transact(self._address, 'pushMany', [names, hashes, anchors],
+                                            gasprice=gasprice, gaslimit=gaslimit)
+        except RPCError as e:
+            return 'push transaction failed: %s' % e
+        txn_hash = response['result']
+        self._trace("Transaction: %s\n" % txn_hash, level=Level.INFO, exact=True)
 
     def _get_refs(self, for_push):
         """
         Return the refs present on the remote.
         """
+        # listing no refs would make git take the remote for an empty one
+        try:
+            return self._read_refs()
+        except RPCError as e:
+            self._fatal('cannot list the refs of %s: %s' % (self._address, e))
+
+    def _read_refs(self):
+        """
+        Read the refs present on the remote.
+        """
         refs = []
+        # read the whole state in a single call where the contract supports it
+        state = client.repo.get_state(self._address)
+        if state is not None:
+            self._head, ref_hashes, head_anchor = state
+            self._push_many = True
+            for ref, sha in ref_hashes:
+                sha = encode_hex(sha)[:40]
+                refs.append('%s %s' % (sha, ref))
+                self._refs[ref] = sha
+                if ref == self._head:
+                    self._anchors[sha] = head_anchor
+            return refs
+
         response = client.repo.call(self._address, 'getHead', [])
 
-        if 'result' in response and len(response['result']) > 0:
+        if len(response['result']) > 0:
             ref_head = response['result'][0].decode("utf-8")
+            self._head = ref_head
 
             response = client.repo.call(self._address, 'getRef', [ref_head])
 
-            if 'result' in response:
+            if response['result']:
                 sha = response['result'][0]
                 sha = encode_hex(sha)[:40]
 
                 refs.append('%s %s' % (sha, ref_head))
+                self._refs[ref_head] = sha
 
         return refs
 
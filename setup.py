@@ -61,7 +61,7 @@ setup(
     include_package_data = True,
 
     install_requires=[
-        'ipfsapi>=0.4',
+        'requests>=2.18.4',
         'two1>=3.10.8',
         'pycrypto>=2.6.1',
         'rlp>=0.6.0',
@@ -12,5 +12,5 @@ infura = Infura(config.attributes['infura_token'], config.attributes['eth_net'])
 ipfs = IPFS('127.0.0.1', 5001)
 account = Account(config, infura)
 
-res = ipfs.connection.add_bytes(b'boom')
+res = ipfs.add_bytes(b'boom')
 import pdb; pdb.set_trace()
@@ -3,8 +3,18 @@ import json
 import rlp
 
 from ethereum.transactions import Transaction
+from ethereum.utils import encode_hex
 
 from utils.crypto import HDPrivateKey, HDKey
+from utils.infura import RPCError
+from utils.nonce import NonceManager
+
+NONCE_RETRIES = 3
+# errors of eth_sendRawTransaction for a nonce taken by a pending or mined transaction
+NONCE_TAKEN = ('nonce too low', 'replacement transaction underpriced')
+# errors of eth_sendRawTransaction for a transaction the node already has, such
+# as one resent after a timeout
+KNOWN_TRANSACTION = ('already known', 'known transaction')
 
 class Account(object):
     def __init__(self, config, infura):
@@ -14,38 +24,65 @@ class Account(object):
         self.root_keys = HDKey.from_path(self.master_key, "m/44'/60'/0'")
         self.acct_priv_key = self.root_keys[-1]
         self.acct_pub_key = self.acct_priv_key.public_key
+        self.nonces = NonceManager(self.config, self.public_key, lambda: self.transaction_count)
 
-    def send_transaction(self, gasprice, startgas, tx_data='', to='', value=0):
-        tx = Transaction(
-            nonce=self.transaction_count,
-            gasprice=gasprice,
-            startgas=startgas,
-            to=to,
-            value=value,
-            data=tx_data,
-        )
-
-        tx.sign(self.private_key.to_hex())
-        raw_tx = rlp.encode(tx)
-        raw_tx_hex = raw_tx.hex()
-
-        payload = {
-          "jsonrpc": "2.0",
-          "id": 0,
-          "method": "eth_sendRawTransaction",
-          "params": ['0x' + raw_tx_hex]
-        }
+    def send_transaction(self, gasprice, startgas, tx_data='', to='', value=0, nonce=None):
+        """
+        Sign and send a transaction with the next nonce, reserved locally.
+
+        Given a nonce, the transaction replaces the pending transaction with
+        that nonce instead.
+        """
+        reserve = nonce is None
+        attempt = 0
+        while True:
+            if reserve:
+                nonce = self.nonces.reserve()
+            tx = Transaction(
+                nonce=nonce,
+                gasprice=gasprice,
+                startgas=startgas,
+                to=to,
+                value=value,
+                data=tx_data,
+            )
+
+            tx.sign(self.private_key.to_hex())
+            raw_tx = rlp.encode(tx)
+            raw_tx_hex = raw_tx.hex()
+
+            payload = {
+              "jsonrpc": "2.0",
+              "id": 0,
+              "method": "eth_sendRawTransaction",
+              "params": ['0x' + raw_tx_hex]
+            }
 
-        request = self.infura.post(payload)
-        return tx, request
+            try:
+                response = self.infura.post(payload)
+            except RPCError as e:
+                message = e.message.lower()
+                if any(error in message for error in KNOWN_TRANSACTION):
+                    return tx, {'result': '0x' + encode_hex(tx.hash)}
+                if not reserve:
+                    raise
+                if any(error in message for error in NONCE_TAKEN):
+                    # another transaction took the nonce, take the next one
+                    self.nonces.reconcile()
+                    if attempt < NONCE_RETRIES:
+                        attempt += 1
+                        continue
+                    raise
+                self.nonces.release(nonce)
+                raise
+            return tx, response
 
     @property
     def transaction_count(self):
         params = {
             "params": json.dumps([self.public_key, 'pending'])
         }
-        request = self.infura.get('eth_getTransactionCount', params)
-        response = request.json()
+        response = self.infura.get('eth_getTransactionCount', params)
 
         count = int(response['result'], 16)
         return count
@@ -55,8 +92,7 @@ class Account(object):
         params = {
             "params": json.dumps([self.public_key, 'latest'])
         }
-        request = self.infura.get('eth_getBalance', params)
-        response = request.json()
+        response = self.infura.get('eth_getBalance', params)
         balance = int(response['result'], 16)
         return balance
 
@@ -0,0 +1,157 @@
+import binascii
+import mmap
+import struct
+
+from protos import anchor_pb2
+
+MAGIC = b'LLYA'
+FOOTER = struct.Struct('>4sIQ') # magic, number of objects, offset of the hash table
+OFFSET = struct.Struct('>Q')
+
+def _varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def _fields(data, pos, end):
+    # yield the number, start, value start and end of each field of a
+    # serialized message, without parsing the values
+    while pos < end:
+        start = pos
+        key, pos = _varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        value = pos
+        if wire_type == 0:
+            _, pos = _varint(data, pos)
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 2:
+            length, value = _varint(data, pos)
+            pos = value + length
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError('unsupported wire type %d' % wire_type)
+        yield number, start, value, pos
+
+def split_anchor(data):
+    """
+    Split a serialized anchor into its header, the serialized anchor without
+    its objects, and its objects as (binary hash, serialized Object) pairs
+    sorted by hash, as written to an anchor file.
+
+    Both the original and the compact version 2 encoding are split at the
+    protobuf wire level, so the objects are neither parsed nor serialized.
+    """
+    header = []
+    objects = []
+    for number, start, value, end in _fields(data, 0, len(data)):
+        if number not in (anchor_pb2.Anchor.OBJECTS_FIELD_NUMBER,
+                          anchor_pb2.Anchor.ENTRIES_FIELD_NUMBER):
+            header.append(data[start:end])
+            continue
+        # map entries and Entry messages both hold the hash in field 1 and
+        # the object in field 2
+        sha = obj = b''
+        for entry_number, _, entry_value, entry_end in _fields(data, value, end):
+            if entry_number == 1:
+                sha = data[entry_value:entry_end]
+            elif entry_number == 2:
+                obj = data[entry_value:entry_end]
+        if number == anchor_pb2.Anchor.OBJECTS_FIELD_NUMBER:
+            sha = binascii.unhexlify(sha)
+        objects.append((bytes(sha), bytes(obj)))
+    objects.sort()
+    return b''.join(header), objects
+
+class AnchorFile(object):
+    """
+    A memory-mapped anchor supporting lookups of single objects.
+
+    The file holds the anchor without its objects, followed by the serialized
+    objects, a table of their binary hashes in sorted order, the offsets of
+    the objects, and a footer. Like a git pack index, the hash table is binary
+    searched, so looking up an object neither parses nor copies the anchor.
+
+    The file is a read-only mapping from hex object hash to serialized
+    `anchor_pb2.Object`.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < FOOTER.size:
+            raise ValueError('not an anchor file: %s' % path)
+        magic, self.count, self.table = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError('not an anchor file: %s' % path)
+        self.offsets = self.table + 20 * self.count
+        self.header = anchor_pb2.Anchor()
+        self.header.ParseFromString(self.map[:self._offset(0)])
+
+    @staticmethod
+    def write(f, header, objects):
+        """Write an anchor file given the header and (binary hash, data) pairs sorted by hash"""
+        offsets = []
+        f.write(header)
+        offset = len(header)
+        shas = []
+        for sha, data in objects:
+            offsets.append(offset)
+            shas.append(sha)
+            f.write(data)
+            offset += len(data)
+        offsets.append(offset)
+        for sha in shas:
+            f.write(sha)
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+        f.write(FOOTER.pack(MAGIC, len(shas), offsets[-1]))
+
+    def _offset(self, i):
+        return OFFSET.unpack_from(self.map, self.offsets + OFFSET.size * i)[0]
+
+    def _sha(self, i):
+        start = self.table + 20 * i
+        return self.map[start:start + 20]
+
+    def _find(self, sha):
+        try:
+            key = binascii.unhexlify(sha)
+        except (TypeError, ValueError):
+            return None
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self._sha(mid)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, sha):
+        return self._find(sha) is not None
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield binascii.hexlify(self._sha(i)).decode('ascii')
+
+    def __getitem__(self, sha):
+        i = self._find(sha)
+        if i is None:
+            raise KeyError(sha)
+        return self.map[self._offset(i):self._offset(i + 1)]
+
+    def close(self):
+        self.map.close()
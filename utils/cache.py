@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+from utils.anchorfile import AnchorFile
+
+class AnchorCache(object):
+    """
+    An on-disk cache of anchors keyed by ipfs hash, stored as `AnchorFile`s.
+
+    Anchors are immutable, so entries never need invalidation. When the cache
+    grows past max_size bytes, the least recently used entries are evicted,
+    using file modification times to track use.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _entry_path(self, ipfs_hash):
+        return os.path.join(self.path, ipfs_hash)
+
+    def get(self, ipfs_hash):
+        """Return the cached anchor file, or None if it is not cached"""
+        path = self._entry_path(ipfs_hash)
+        try:
+            anchor_file = AnchorFile(path)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            # entries of older versions are not anchor files
+            return None
+        return anchor_file
+
+    def put(self, ipfs_hash, header, objects):
+        """Add an anchor to the cache, evicting old entries if needed, and return its anchor file
+
+        header is the serialized anchor without objects and objects are pairs of
+        binary hash and serialized object, sorted by hash.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as entry:
+            AnchorFile.write(entry, header, objects)
+        path = self._entry_path(ipfs_hash)
+        os.rename(tmp_path, path)
+        # opened before evicting, the mapping outlives the entry being evicted
+        anchor_file = AnchorFile(path)
+        self._evict()
+        return anchor_file
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.startswith('.tmp-'):
+                continue
+            try:
+                stat = os.stat(self._entry_path(name))
+            except OSError:
+                continue # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(self._entry_path(name))
+            except OSError:
+                pass
+            size -= entry_size
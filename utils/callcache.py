@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+
+CALL_CACHE_PATH = os.path.join(os.environ['HOME'], '.lly_calls.db')
+BLOCK_TTL = 5  # seconds the latest block number is used before it is read again
+
+class Flight(object):
+    """A call in progress, which concurrent identical calls wait for instead of making it again"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class CallCache(object):
+    """
+    A cache of eth_call results keyed by (contract address, calldata, block
+    number).
+
+    Calls are made against the latest block. Its number is kept for ttl
+    seconds; once it is older, the caller reads it again in the same request
+    as the calls it makes and hands both over through set_block and
+    put_many, so cached results are only invalidated when a new block comes
+    in. Identical calls made concurrently
+    share a single request.
+
+    With a path, results and the latest block number are also kept in a
+    SQLite database there, which short-lived processes share.
+    """
+
+    def __init__(self, path=None, ttl=BLOCK_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.block_lock = threading.Lock()
+        self.block = None
+        self.block_time = 0
+        self.results = {}
+        self.flights = {}
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self.lock, self.connection:
+                self.connection.execute('PRAGMA journal_mode=WAL')
+                self.connection.execute('PRAGMA synchronous=NORMAL')
+                self.connection.execute('CREATE TABLE IF NOT EXISTS calls '
+                                        '(address TEXT NOT NULL, data TEXT NOT NULL, '
+                                        'block INTEGER NOT NULL, result TEXT NOT NULL, '
+                                        'PRIMARY KEY (address, data, block))')
+                self.connection.execute('CREATE TABLE IF NOT EXISTS latest '
+                                        '(id INTEGER PRIMARY KEY CHECK (id = 0), '
+                                        'block INTEGER NOT NULL, time REAL NOT NULL)')
+
+    def fresh_block(self):
+        """Return the number of the latest block if it is less than ttl seconds old, otherwise None"""
+        with self.block_lock:
+            return self._fresh_block()
+
+    def set_block(self, block):
+        """Make block, read by the caller along with its calls, the latest block and return it"""
+        with self.block_lock:
+            if self.block is not None and block < self.block:
+                # read before the block another call got
+                return block
+            now = time.time()
+            self._store_block(block, now)
+            return self._adopt_block(block, now)
+
+    def put_many(self, address, items, block):
+        """Cache the results of calls made at block, given as (calldata, result) pairs"""
+        address = address.lower()
+        items = [((address, data, block), result) for data, result in items]
+        self._store(items)
+        with self.lock:
+            if block == self.block:
+                self.results.update(items)
+
+    def _fresh_block(self):
+        now = time.time()
+        if self.block is not None and now - self.block_time < self.ttl:
+            return self.block
+        block, block_time = self._load_block()
+        if block is None or now - block_time >= self.ttl:
+            return None
+        return self._adopt_block(block, block_time)
+
+    def _adopt_block(self, block, block_time):
+        if block != self.block:
+            # results of older blocks are never asked for again
+            with self.lock:
+                self.results = {}
+        self.block, self.block_time = block, block_time
+        return block
+
+    def get(self, address, data, block, fetch):
+        """Return the result of a call, calling fetch() for it if it is not cached"""
+        return self.get_many(address, [data], block, lambda missing: [fetch()])[0]
+
+    def get_many(self, address, calls, block, fetch):
+        """
+        Return the results of several calls, given by their calldata.
+
+        fetch is called with the calldata of the calls that are not cached and
+        returns their results in the same order.
+        """
+        address = address.lower()
+        keys = [(address, data, block) for data in calls]
+        results = {}
+        owned = []
+        waiting = []
+        seen = set()
+        with self.lock:
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                if key in self.results:
+                    results[key] = self.results[key]
+                elif key in self.flights:
+                    waiting.append((key, self.flights[key]))
+                else:
+                    self.flights[key] = Flight()
+                    owned.append(key)
+
+        if owned:
+            try:
+                found = self._load(owned)
+                missing = [key for key in owned if key not in found]
+                if missing:
+                    fetched = fetch([data for _, data, _ in missing])
+                    self._store(list(zip(missing, fetched)))
+                    found.update(zip(missing, fetched))
+            except Exception as e:
+                self._land(owned, {}, e)
+                raise
+            self._land(owned, found, None)
+            results.update(found)
+
+        for key, flight in waiting:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            results[key] = flight.result
+        return [results[key] for key in keys]
+
+    def _land(self, keys, results, error):
+        with self.lock:
+            for key in keys:
+                flight = self.flights.pop(key)
+                if error is None:
+                    flight.result = results[key]
+                    if key[2] == self.block:
+                        self.results[key] = flight.result
+                flight.error = error
+                flight.event.set()
+
+    def _load_block(self):
+        if self.connection is None:
+            return None, 0
+        with self.lock:
+            row = self.connection.execute('SELECT block, time FROM latest').fetchone()
+        return tuple(row) if row else (None, 0)
+
+    def _store_block(self, block, block_time):
+        if self.connection is None:
+            return
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO latest (id, block, time) VALUES (0, ?, ?)',
+                                    (block, block_time))
+            self.connection.execute('DELETE FROM calls WHERE block < ?', (block,))
+
+    def _load(self, keys):
+        if self.connection is None:
+            return {}
+        found = {}
+        with self.lock:
+            for key in keys:
+                row = self.connection.execute('SELECT result FROM calls '
+                                              'WHERE address = ? AND data = ? AND block = ?',
+                                              key).fetchone()
+                if row:
+                    found[key] = row[0]
+        return found
+
+    def _store(self, items):
+        if self.connection is None:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO calls (address, data, block, result) '
+                                        'VALUES (?, ?, ?, ?)',
+                                        [key + (result,) for key, result in items])
+
+    def close(self):
+        if self.connection is not None:
+            with self.lock:
+                self.connection.close()
@@ -0,0 +1,100 @@
+import hashlib
+import struct
+
+MIN_SIZE = 16 << 10
+AVG_SIZE = 64 << 10
+MAX_SIZE = 256 << 10
+READ_SIZE = 1 << 20
+
+# fixed so that every client cuts the same data at the same boundaries
+GEAR = [struct.unpack('>I', hashlib.sha256(struct.pack('>I', i)).digest()[:4])[0]
+        for i in range(256)]
+
+# the hash is computed for a block of positions at once, in lanes of a single
+# integer, so the work is done by integer operations rather than per byte
+BLOCK_SIZE = 8 << 10
+LANE_BYTES = 5
+LANE_BITS = LANE_BYTES * 8
+# each byte of the gear values, to look them up with bytes.translate
+GEAR_BYTES = [bytes((value >> (8 * i)) & 0xff for value in GEAR) for i in range(4)]
+
+
+def lanes(value, count):
+    """Return an integer holding value in each of count lanes"""
+    return int.from_bytes(value.to_bytes(LANE_BYTES, 'little') * count, 'little')
+
+
+class Chunker(object):
+    """
+    A content-defined chunker.
+
+    Chunk boundaries are picked with a gear rolling hash over the data, so an
+    edit only changes the chunks around it and the other chunks of a new
+    version of the data are identical to those of the old one.
+    """
+
+    def __init__(self, min_size=MIN_SIZE, avg_size=AVG_SIZE, max_size=MAX_SIZE):
+        assert 0 < min_size <= avg_size <= max_size
+        self.min_size = min_size
+        self.max_size = max_size
+        # a boundary is where the top bits of the hash are all zero, which
+        # happens once every avg_size bytes on average
+        bits = max(avg_size.bit_length() - 1, 1)
+        self.mask = ((1 << bits) - 1) << (32 - bits)
+
+        count = BLOCK_SIZE + 31
+        # the bits of a lane that stay within 32 bits when shifted by 1, 2, 4,
+        # 8 and 16 bits
+        self._low = [lanes((1 << (32 - (1 << i))) - 1, count) for i in range(5)]
+        self._mask = lanes(self.mask, count)
+        # carries into bit 32 of a lane unless the masked hash is zero
+        self._carry = lanes((1 << 32) - (self.mask & -self.mask), count)
+        self._flags = lanes(1 << 32, count)
+
+    def _cut(self, data):
+        size = min(len(data), self.max_size)
+        if size <= self.min_size:
+            return size
+        start = self.min_size
+        while start < size:
+            end = min(start + BLOCK_SIZE, size)
+            # the hash starts at min_size and covers the last 32 bytes, so the
+            # block is preceded by up to 31 bytes to get it for every position
+            context = min(start - self.min_size, 31)
+            block = bytes(data[start - context:end])
+            count = len(block)
+            buf = bytearray(LANE_BYTES * count)
+            for i, gear in enumerate(GEAR_BYTES):
+                buf[i::LANE_BYTES] = block.translate(gear)
+            h = int.from_bytes(buf, 'little')
+            # h = (h << 1) + GEAR[byte] for every byte, as the sum of the gear
+            # values of the last 32 bytes, each shifted by its distance, which
+            # is summed in five doubling steps, modulo 2 ** 32 in the low 32
+            # bits of each lane
+            for i in range(5):
+                h += (h & self._low[i]) << ((LANE_BITS + 1) << i)
+            flags = self._flags
+            if count < BLOCK_SIZE + 31:
+                flags &= (1 << (LANE_BITS * count)) - 1
+            cuts = ((((h & self._mask) + self._carry) & flags) ^ flags) >> (LANE_BITS * context)
+            if cuts:
+                # the first boundary is the lowest lane with its flag set
+                return start + ((cuts & -cuts).bit_length() - 33) // LANE_BITS + 1
+            start = end
+        return size
+
+    def split(self, stream):
+        """Yield the chunks of the data read from a file object"""
+        buffer = bytearray()
+        eof = False
+        while True:
+            while not eof and len(buffer) < self.max_size:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    eof = True
+                buffer += data
+            if not buffer:
+                return
+            cut = self._cut(buffer)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
@@ -1,8 +1,9 @@
 import os
 
 from utils.account import Account
-from utils.infura import Infura
-from utils.ipfs import IPFS
+from utils.callcache import CallCache, CALL_CACHE_PATH
+from utils.infura import Infura, MAX_RETRIES
+from utils.ipfs import IPFS, DEFAULT_PORT
 from utils.crypto import HDPrivateKey
 from utils.repo import Repo
 from utils.config import Config
@@ -20,9 +21,19 @@ class Client(object):
         eth_net = self.config.attributes['eth_net'] if 'eth_net' in self.config.attributes else 'mainnet'
 
         if 'infura_token' in self.config.attributes:
-            self.infura = Infura(self.config.attributes['infura_token'], eth_net)
+            rpc_timeout = float(self.config.attributes.get('rpc_timeout', 60))
+            rpc_retries = int(self.config.attributes.get('rpc_retries', MAX_RETRIES))
+            self.infura = Infura(self.config.attributes['infura_token'], eth_net,
+                                 self.config.attributes.get('rpc_url'),
+                                 timeout=(10, rpc_timeout), max_retries=rpc_retries)
             self.account = Account(self.config, self.infura)
             self.repo = Repo(self.account, self.infura, CONTRACT_BIN, CONTRACT_ABI)
+            # memory (the default), disk to share results between processes, or none
+            call_cache = self.config.attributes.get('call_cache', 'memory')
+            if call_cache != 'none':
+                path = CALL_CACHE_PATH if call_cache == 'disk' else None
+                self.repo.cache = CallCache(path)
 
         if 'ipfs_gateway' in self.config.attributes:
-            self.ipfs = IPFS(self.config.attributes['ipfs_gateway'])
+            ipfs_port = int(self.config.attributes.get('ipfs_port', DEFAULT_PORT))
+            self.ipfs = IPFS(self.config.attributes['ipfs_gateway'], ipfs_port)
@@ -0,0 +1,59 @@
+import bz2
+import lzma
+import zlib
+
+class Codec(object):
+    """
+    A compression codec for data stored on ipfs.
+
+    compressor and decompressor create the incremental (de)compression objects
+    of the codec, such as zlib.compressobj and zlib.decompressobj.
+    """
+
+    def __init__(self, compressor, decompressor):
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+    def compress(self, data):
+        """Return the compressed data"""
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        """Return the decompressed data"""
+        return self.decompressor().decompress(data)
+
+    def compress_stream(self, stream):
+        """Return a file object reading the compressed data of a file object"""
+        return CompressedStream(stream, self.compressor())
+
+class CompressedStream(object):
+    """
+    A file object compressing the data read from another file object as it
+    is read.
+    """
+
+    def __init__(self, stream, compressor):
+        self.stream = stream
+        self.compressor = compressor
+        self.eof = False
+
+    def read(self, size):
+        """Read at least one byte of compressed data, or b'' at the end"""
+        data = b''
+        while not data and not self.eof:
+            chunk = self.stream.read(size)
+            if chunk:
+                data = self.compressor.compress(chunk)
+            else:
+                data = self.compressor.flush()
+                self.eof = True
+        return data
+
+# codecs by the name they are selected with in ~/.lly, the names match the
+# values of Object.Codec in anchor.proto
+CODECS = {
+    'zlib': Codec(zlib.compressobj, zlib.decompressobj),
+    'lzma': Codec(lzma.LZMACompressor, lzma.LZMADecompressor),
+    'bz2': Codec(bz2.BZ2Compressor, bz2.BZ2Decompressor),
+}
@@ -1,4 +1,37 @@
 import configparser
+import os
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+def lock_file(lock):
+    """Lock an open file, waiting for other processes holding it"""
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return
+    # the first byte stands for the whole file
+    lock.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after about ten seconds
+            pass
+
+
+def unlock_file(lock):
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        return
+    lock.seek(0)
+    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
 
 class Config(object):
     def __init__(self, path, account):
@@ -8,7 +41,33 @@ class Config(object):
         self.config.read(self.path)
         self.attributes = self.config[self.account]
 
-    def write(self):
-        with open(self.path, 'w') as configfile:
+    def write(self, quiet=False):
+        # replace the file at once, it holds the mnemonic
+        tmp_path = '%s.tmp' % self.path
+        mode = 0o600
+        if os.path.exists(self.path):
+            mode = os.stat(self.path).st_mode
+        # set the mode before anything is written, also on a stale file
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'w') as configfile:
             self.config.write(configfile)
+        os.replace(tmp_path, self.path)
+        if not quiet:
             print('Wrote config to: %s' % self.path)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Lock the config file, read it again and write it back quietly once the
+        block is done, so that processes updating it at the same time keep
+        each other's changes.
+        """
+        with open('%s.lock' % self.path, 'a') as lock:
+            lock_file(lock)
+            try:
+                self.config.read(self.path)
+                yield self.config
+                self.write(quiet=True)
+            finally:
+                unlock_file(lock)
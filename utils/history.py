@@ -0,0 +1,122 @@
+import os
+import sqlite3
+
+import base58
+
+from utils.infura import RPCError
+
+HISTORY_PATH = os.path.join(os.environ['HOME'], '.lly_history.db')
+BLOCK_RANGE = 10000  # blocks read per eth_getLogs call at first
+MAX_BLOCK_RANGE = 100000
+REORG_DEPTH = 12  # blocks up to the high-water mark read again, as they may have been reorganized
+LIMIT_EXCEEDED = -32005  # error code of an eth_getLogs call matching too many logs
+
+class History(object):
+    """
+    A local index of the pushes to repository contracts, read from their Push
+    events.
+
+    Every repository is scanned up to a high-water mark, the last block read,
+    so a sync only reads the blocks added since the previous one. The blocks
+    are read in bounded ranges, each committed with the high-water mark, so an
+    interrupted sync keeps what it read.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS repos '
+                                    '(address TEXT PRIMARY KEY, block INTEGER NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pushes '
+                                    '(address TEXT NOT NULL, block INTEGER NOT NULL, '
+                                    'log_index INTEGER NOT NULL, txn TEXT NOT NULL, '
+                                    'sender TEXT NOT NULL, ref TEXT NOT NULL, sha TEXT NOT NULL, '
+                                    'anchor TEXT NOT NULL, PRIMARY KEY (address, block, log_index))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS pushes_ref '
+                                    'ON pushes (address, ref, block)')
+
+    def high_water_mark(self, address):
+        """Return the last block read for a repository, or None if it has not been synced"""
+        row = self.connection.execute('SELECT block FROM repos WHERE address = ?',
+                                      (address.lower(),)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, repo, address, start_block=0, block_range=BLOCK_RANGE):
+        """
+        Read the Push events of a repository through repo, a `utils.repo.Repo`,
+        from its high-water mark up to the latest block, and return the number
+        of pushes read.
+
+        start_block is where the first sync of a repository starts, such as the
+        block its contract was deployed in.
+        """
+        address = address.lower()
+        mark = self.high_water_mark(address)
+        if mark is not None:
+            start_block = max(start_block, mark - REORG_DEPTH + 1)
+        latest = repo.block_number()
+        count = 0
+        limited = False  # whether the node capped a range, which is not grown after that
+        while start_block <= latest:
+            end_block = min(start_block + block_range - 1, latest)
+            try:
+                pushes = repo.get_pushes(address, start_block, end_block)
+            except RPCError as e:
+                # nodes cap the logs of a single call, read fewer blocks at once
+                if e.code != LIMIT_EXCEEDED or end_block == start_block:
+                    raise
+                block_range = max(block_range // 2, 1)
+                limited = True
+                continue
+            rows = [(address, push['block'], push['log_index'], push['transaction'], push['sender'],
+                     push['ref'], push['hash'], self._anchor(push['content_address']))
+                    for push in pushes]
+            with self.connection:
+                # replaces what was read of the range before a reorganization
+                self.connection.execute('DELETE FROM pushes WHERE address = ? AND block BETWEEN ? AND ?',
+                                        (address, start_block, end_block))
+                self.connection.executemany('INSERT OR REPLACE INTO pushes '
+                                            '(address, block, log_index, txn, sender, ref, sha, anchor) '
+                                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self.connection.execute('INSERT OR REPLACE INTO repos (address, block) VALUES (?, ?)',
+                                        (address, end_block))
+            count += len(rows)
+            start_block = end_block + 1
+            if not limited:
+                block_range = min(block_range * 2, MAX_BLOCK_RANGE)
+        return count
+
+    def pushes(self, address, ref=None, limit=None):
+        """
+        Return the pushes to a repository, or to a single ref of it, newest
+        first, as (block, transaction, sender, ref, git hash, ipfs hash) tuples.
+        """
+        query = 'SELECT block, txn, sender, ref, sha, anchor FROM pushes WHERE address = ?'
+        args = [address.lower()]
+        if ref is not None:
+            query += ' AND ref = ?'
+            args.append(ref)
+        query += ' ORDER BY block DESC, log_index DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        return [tuple(row) for row in self.connection.execute(query, args)]
+
+    def repos(self):
+        """Return the synced repositories as (address, high-water mark, number of pushes) tuples"""
+        rows = self.connection.execute('SELECT repos.address, repos.block, COUNT(pushes.block) '
+                                       'FROM repos LEFT JOIN pushes ON pushes.address = repos.address '
+                                       'GROUP BY repos.address ORDER BY repos.address')
+        return [tuple(row) for row in rows]
+
+    def _anchor(self, content_address):
+        if not any(bytearray(content_address)):
+            return ''
+        return base58.b58encode(b'\x12 ' + content_address)
+
+    def close(self):
+        self.connection.close()
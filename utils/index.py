@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import threading
+
+class ObjectIndex(object):
+    """
+    A persistent map from git object hashes to the ipfs hashes they are
+    stored at, and the codec they are compressed with.
+
+    The index is shared by all threads; access is serialized with a lock.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            # every entry is committed on its own, so that an interrupted push
+            # keeps what it uploaded; WAL makes those commits cheap
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS objects '
+                                    '(sha TEXT PRIMARY KEY, cid TEXT NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS chunks '
+                                    '(cid TEXT PRIMARY KEY)')
+            # indexes created before codecs only hold uncompressed objects
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(objects)')]
+            if 'codec' not in columns:
+                self.connection.execute('ALTER TABLE objects '
+                                        'ADD COLUMN codec INTEGER NOT NULL DEFAULT 0')
+
+    def get(self, sha):
+        """Return the ipfs hash and codec of the object, or None if it is not indexed"""
+        with self.lock:
+            row = self.connection.execute('SELECT cid, codec FROM objects WHERE sha = ?',
+                                          (sha,)).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, sha, cid, codec=0):
+        """Record the ipfs hash an object is stored at and its codec"""
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO objects (sha, cid, codec) '
+                                    'VALUES (?, ?, ?)', (sha, cid, codec))
+
+    def has_chunk(self, cid):
+        """Return whether a blob chunk is known to be stored on ipfs"""
+        with self.lock:
+            row = self.connection.execute('SELECT 1 FROM chunks WHERE cid = ?',
+                                          (cid,)).fetchone()
+        return row is not None
+
+    def put_chunk(self, cid):
+        """Record that a blob chunk is stored on ipfs"""
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO chunks (cid) VALUES (?)', (cid,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
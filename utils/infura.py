@@ -1,17 +1,133 @@
 import json
 import os
+import random
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 10
+TIMEOUT = (10, 60) # seconds to connect, and between bytes of a response
+MAX_RETRIES = 5
+BACKOFF = 0.5 # seconds before the first retry, doubled for every further one
+MAX_BACKOFF = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class RPCError(Exception):
+    """
+    An Ethereum RPC request failed, either with a JSON-RPC error or because
+    the node could not be reached.
+
+    code is the JSON-RPC error code or the HTTP status, if there is one.
+    """
+
+    def __init__(self, message, code=None):
+        super(RPCError, self).__init__(message)
+        self.message = message
+        self.code = code
 
 class Infura(object):
-    def __init__(self, api_token, eth_net='mainnet'):
+    """
+    A client for infura, or any other Ethereum JSON-RPC endpoint.
+
+    Requests go through per-thread sessions sharing a pool of keep-alive
+    connections. Requests failing with a connection error, a timeout, 429 or
+    5xx are retried with jittered exponential backoff. Errors are raised as
+    `RPCError`, successful requests return the decoded response.
+    """
+
+    def __init__(self, api_token, eth_net='mainnet', rpc_url=None, timeout=TIMEOUT,
+                 max_retries=MAX_RETRIES):
         self.api_token = api_token
         self.base_url = os.path.join('https://api.infura.io/v1/jsonrpc/', eth_net)
+        # a plain JSON-RPC endpoint, such as a local node, used instead of infura
+        self.rpc_url = rpc_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        """Get the session of the calling thread"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self.local.session = session
+        return session
+
+    def _backoff(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(int(retry_after), MAX_BACKOFF)
+        return random.uniform(0, min(BACKOFF * 2 ** attempt, MAX_BACKOFF))
+
+    def _send(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = RPCError('request to %s failed: %s' % (url, e))
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                error = RPCError('request to %s failed with HTTP %d' % (url, response.status_code),
+                                 response.status_code)
+            if attempt >= self.max_retries:
+                raise error
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+        if not response.ok:
+            raise RPCError('request to %s failed with HTTP %d' % (url, response.status_code),
+                           response.status_code)
+        try:
+            return response.json()
+        except ValueError:
+            raise RPCError('invalid response from %s' % url)
+
+    def _check(self, response):
+        if isinstance(response, dict) and 'error' in response:
+            error = response['error']
+            if isinstance(error, dict):
+                raise RPCError(error.get('message', 'unknown error'), error.get('code'))
+            raise RPCError(str(error))
+        return response
 
     def get(self, method, params):
+        if self.rpc_url is not None:
+            return self.post(self._request(0, method, json.loads(params['params'])))
         params['token'] = self.api_token
         url = os.path.join(self.base_url, method)
-        return requests.get(url, params)
+        return self._check(self._send('GET', url, params=params))
 
     def post(self, payload):
         headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-        return requests.post(self.base_url + '?%s' % self.api_token, data=json.dumps(payload), headers=headers)
+        url = self.rpc_url if self.rpc_url is not None else self.base_url + '?%s' % self.api_token
+        return self._check(self._send('POST', url, data=json.dumps(payload), headers=headers))
+
+    def batch(self, calls):
+        """Make several (method, params) JSON-RPC calls in one request and return the responses in order"""
+        payload = [self._request(i, method, params) for i, (method, params) in enumerate(calls)]
+        # a batch rejected as a whole is answered with a single error
+        responses = self.post(payload)
+        # responses may come back in any order
+        by_id = dict((response.get('id'), response) for response in responses)
+        results = []
+        for i in range(len(payload)):
+            if i not in by_id:
+                raise RPCError('no response to %s' % payload[i]['method'])
+            results.append(self._check(by_id[i]))
+        return results
+
+    def ticker(self, symbol):
+        """Get the current price of a currency pair, such as ethusd"""
+        return self._check(self._send('GET', 'https://api.infura.io/v1/ticker/%s' % symbol))
+
+    def _request(self, request_id, method, params):
+        return {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
@@ -1,7 +1,99 @@
-import json
-import os
-import ipfsapi
+import threading
+import uuid
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_PORT = 5001
+POOL_SIZE = 20 # matches the number of threads the remote helper transfers with
+TIMEOUT = (10, 120) # seconds to connect, and between bytes of a response
+CHUNK_SIZE = 1 << 20 # bytes read from a stream per chunk of an upload
 
 class IPFS(object):
-    def __init__(self, gateway, base=None):
-        self.connection = ipfsapi.connect(gateway)
+    """
+    A client for the ipfs HTTP API.
+
+    Each thread gets its own session, and all sessions share one pool of at most
+    pool_size keep-alive connections, so concurrent requests neither contend
+    on a single client nor set up a new connection per call.
+    """
+
+    def __init__(self, gateway, port=DEFAULT_PORT, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        self.base_url = 'http://%s:%d/api/v0' % (gateway, port)
+        self.timeout = timeout
+        # block when every connection is in use instead of opening extra ones
+        # that would be thrown away afterwards
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        """Get the session of the calling thread"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            self.local.session = session
+        return session
+
+    def _request(self, command, **kwargs):
+        response = self.session.post('%s/%s' % (self.base_url, command), timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def add_bytes(self, data):
+        """Add data to ipfs and return its ipfs hash"""
+        response = self._request('add', files={'file': ('file', data)})
+        return response.json()['Hash']
+
+    def add_stream(self, stream):
+        """Add data read from a file object to ipfs and return its ipfs hash
+
+        The request body is sent with chunked transfer encoding as the data is
+        read, so it is never held in memory as a whole.
+        """
+        boundary = uuid.uuid4().hex
+        headers = {'Content-Type': 'multipart/form-data; boundary=%s' % boundary}
+        response = self._request('add', data=self._multipart(stream, boundary), headers=headers)
+        return response.json()['Hash']
+
+    def _multipart(self, stream, boundary):
+        yield ('--%s\r\n'
+               'Content-Disposition: form-data; name="file"; filename="file"\r\n'
+               'Content-Type: application/octet-stream\r\n\r\n' % boundary).encode('utf8')
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield ('\r\n--%s--\r\n' % boundary).encode('utf8')
+
+    def cat(self, ipfs_hash):
+        """Get the data stored at an ipfs hash"""
+        return self._request('cat', params={'arg': ipfs_hash}).content
+
+    @contextmanager
+    def cat_stream(self, ipfs_hash):
+        """Get a file object reading the data stored at an ipfs hash
+
+        The response body is read as it arrives, so it is never held in memory
+        as a whole. The connection is released once the block is done.
+        """
+        response = self._request('cat', params={'arg': ipfs_hash}, stream=True)
+        try:
+            yield response.raw
+        finally:
+            response.close()
+
+    def block_put(self, data):
+        """Store data as a raw ipfs block and return its ipfs hash"""
+        # newer nodes default to CIDv1, ask for the base58 sha2-256 hashes
+        # that are stored in anchors
+        params = {'format': 'v0', 'mhtype': 'sha2-256'}
+        response = self._request('block/put', params=params, files={'data': ('data', data)})
+        return response.json()['Key']
+
+    def block_get(self, ipfs_hash):
+        """Get the data of a raw ipfs block"""
+        return self._request('block/get', params={'arg': ipfs_hash}).content
@@ -0,0 +1,86 @@
+import time
+
+SECTION = 'nonces'
+GAP_TIMEOUT = 120  # seconds after which nonces reserved but not pending on the network are handed out again
+
+class NonceManager(object):
+    """
+    Hands out the nonces of an account's transactions locally, so that
+    transactions are signed and sent back to back without asking the network
+    for the transaction count before each one.
+
+    The next nonce, the nonces released after their transaction failed to be
+    sent and the time of the last reservation are kept in the nonces section
+    of the config file, shared by all processes. They are reconciled with the
+    pending transaction count of the account on the first reservation of a
+    process and whenever the network rejects a nonce.
+    """
+
+    def __init__(self, config, address, transaction_count):
+        self.config = config
+        self.address = address.lower()
+        # returns the pending transaction count of the account
+        self.transaction_count = transaction_count
+        self.reconciled = False
+
+    def reserve(self):
+        """Reserve and return the next nonce"""
+        pending = None if self.reconciled else self.transaction_count()
+        with self.config.transaction() as config:
+            next_nonce, gaps, reserved = self._load(config)
+            if pending is not None:
+                next_nonce, gaps = self._reconcile(next_nonce, gaps, reserved, pending)
+            if gaps:
+                # fill the gaps first, the transactions after them are stuck
+                nonce = gaps.pop(0)
+            else:
+                nonce = next_nonce
+                next_nonce += 1
+            self._store(config, next_nonce, gaps, time.time())
+        self.reconciled = True
+        return nonce
+
+    def release(self, nonce):
+        """Hand out a reserved nonce again, after its transaction failed to be sent"""
+        with self.config.transaction() as config:
+            next_nonce, gaps, reserved = self._load(config)
+            if nonce < next_nonce and nonce not in gaps:
+                gaps = sorted(gaps + [nonce])
+            while gaps and gaps[-1] == next_nonce - 1:
+                next_nonce = gaps.pop()
+            self._store(config, next_nonce, gaps, reserved)
+
+    def reconcile(self):
+        """Reconcile the nonces with the pending transaction count, after a nonce was rejected"""
+        pending = self.transaction_count()
+        with self.config.transaction() as config:
+            next_nonce, gaps, reserved = self._load(config)
+            next_nonce, gaps = self._reconcile(next_nonce, gaps, reserved, pending)
+            self._store(config, next_nonce, gaps, reserved)
+        self.reconciled = True
+
+    def _reconcile(self, next_nonce, gaps, reserved, pending):
+        # nonces below the pending count are taken, by this or another client
+        gaps = [nonce for nonce in gaps if nonce >= pending]
+        if next_nonce <= pending or time.time() - reserved > GAP_TIMEOUT:
+            # the nonces reserved from the pending count on never reached the
+            # network, or were dropped from it
+            return pending, []
+        return next_nonce, gaps
+
+    def _load(self, config):
+        if not config.has_section(SECTION):
+            return 0, [], 0
+        section = config[SECTION]
+        next_nonce = int(section.get(self.address, 0))
+        gaps = [int(nonce) for nonce in section.get('%s_gaps' % self.address, '').split()]
+        reserved = float(section.get('%s_reserved' % self.address, 0))
+        return next_nonce, gaps, reserved
+
+    def _store(self, config, next_nonce, gaps, reserved):
+        if not config.has_section(SECTION):
+            config.add_section(SECTION)
+        section = config[SECTION]
+        section[self.address] = str(next_nonce)
+        section['%s_gaps' % self.address] = ' '.join(str(nonce) for nonce in gaps)
+        section['%s_reserved' % self.address] = repr(reserved)
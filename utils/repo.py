@@ -1,13 +1,20 @@
 import binascii
 import json
 
-from ethereum.abi import ContractTranslator
+from ethereum.abi import ContractTranslator, event_id
 from ethereum.utils import sha3, encode_hex, zpad
 
+from utils.infura import RPCError
+
+REF_PAGE_SIZE = 100 # refs read per getState call
+PUSH_TOPIC = '0x%064x' % event_id('Push', ['address', 'bytes32', 'string', 'bytes32'])
+
 class Repo(object):
     def __init__(self, account, infura, bin_path, abi_path):
         self.account = account
         self.infura = infura
+        # a `utils.callcache.CallCache` of call results, if any
+        self.cache = None
 
         with open(bin_path, 'rb') as contract_file:
             contract_bin = contract_file.read().replace(b"\n", b"")
@@ -20,24 +27,131 @@ class Repo(object):
         constructor_args = self.contract.encode_constructor_arguments([ref_head])
         tx, response = self.account.send_transaction(gasprice, startgas, self.contract_bin + constructor_args)
         contract_address = '0x' + encode_hex(tx.creates)
-        return contract_address, response.json()
+        return contract_address, response
 
     def transact(self, contract_address, function, args, value=0, gasprice=15000000000, gaslimit=140000):
         txdata = self.contract.encode_function_call(function, args)
         tx, response = self.account.send_transaction(gasprice, gaslimit, txdata, to=contract_address, value=value)
-        return response.json()
+        return response
 
     def call(self, contract_address, function, args):
-        txdata = self.contract.encode_function_call(function, args)
+        txdata = "0x" + encode_hex(self.contract.encode_function_call(function, args))
+        if self.cache is None:
+            response = self._eth_call(contract_address, txdata, 'latest')
+            return self._decode_result(function, response)
+
+        # results are cached for the block they were read at
+        block = self.cache.fresh_block()
+        if block is None:
+            result = self._eth_call_at_latest(contract_address, [txdata])[0]
+        else:
+            result = self.cache.get(contract_address, txdata, block,
+                                    lambda: self._eth_call(contract_address, txdata, hex(block))['result'])
+        return self._decode_result(function, {'result': result})
+
+    def call_many(self, contract_address, calls):
+        """Make several calls, given as (function, args) pairs, in one batched request and return the responses in order"""
+        txdatas = ["0x" + encode_hex(self.contract.encode_function_call(function, args))
+                   for function, args in calls]
+        if self.cache is None:
+            responses = self._eth_call_many(contract_address, txdatas, 'latest')
+        else:
+            # only the calls not cached for the block are made
+            block = self.cache.fresh_block()
+            if block is None:
+                results = self._eth_call_at_latest(contract_address, txdatas)
+            else:
+                results = self.cache.get_many(contract_address, txdatas, block, lambda missing: [
+                    response['result'] for response in self._eth_call_many(contract_address, missing, hex(block))])
+            responses = [{'result': result} for result in results]
+        return [self._decode_result(function, response)
+                for (function, _), response in zip(calls, responses)]
+
+    def _eth_call(self, contract_address, txdata, block):
         params = {
             "params": json.dumps([{
                 "to": contract_address,
-                "data": "0x" + encode_hex(txdata)
-            }, 'latest'])
+                "data": txdata
+            }, block])
+        }
+        return self.infura.get('eth_call', params)
+
+    def _eth_call_many(self, contract_address, txdatas, block):
+        return self.infura.batch(self._eth_call_requests(contract_address, txdatas, block))
+
+    def _eth_call_requests(self, contract_address, txdatas, block):
+        return [('eth_call', [{"to": contract_address, "data": txdata}, block])
+                for txdata in txdatas]
+
+    def _eth_call_at_latest(self, contract_address, txdatas):
+        # the latest block number is read in the same request as the calls,
+        # and their results are cached for it
+        responses = self.infura.batch([('eth_blockNumber', [])] +
+                                      self._eth_call_requests(contract_address, txdatas, 'latest'))
+        block = self.cache.set_block(int(responses[0]['result'], 16))
+        results = [response['result'] for response in responses[1:]]
+        self.cache.put_many(contract_address, list(zip(txdatas, results)), block)
+        return results
+
+    def get_state(self, contract_address, page_size=REF_PAGE_SIZE):
+        """Get the head ref, (ref, hash) pairs of all refs and the anchor of the head
+
+        Return None if the contract predates getState.
+        """
+        refs = []
+        offset = 0
+        while True:
+            try:
+                response = self.call(contract_address, 'getState', [offset, page_size])
+            except RPCError as e:
+                if 'revert' not in e.message:
+                    raise
+                return None
+            if not response['result']:
+                return None
+            head, names, hashes, head_anchor, total = response['result']
+            # every name is followed by a newline
+            refs.extend(zip(names.decode('utf-8').split('\n')[:-1], hashes))
+            offset += len(hashes)
+            if not hashes or offset >= total:
+                return head.decode('utf-8'), refs, head_anchor
+
+    def block_number(self):
+        """Get the number of the latest block"""
+        response = self.infura.get('eth_blockNumber', {"params": json.dumps([])})
+        return int(response['result'], 16)
+
+    def get_pushes(self, contract_address, from_block, to_block):
+        """Get the Push events of the contract from from_block up to and including to_block, oldest first"""
+        params = {
+            "params": json.dumps([{
+                "address": contract_address,
+                "fromBlock": hex(from_block),
+                "toBlock": hex(to_block),
+                "topics": [PUSH_TOPIC]
+            }])
         }
+        response = self.infura.get('eth_getLogs', params)
 
-        response = self.infura.get('eth_call', params).json()
+        pushes = []
+        for log in response['result']:
+            if log.get('removed'):
+                continue
+            topics = [int(topic, 16) for topic in log['topics']]
+            event = self.contract.decode_event(topics, binascii.unhexlify(log['data'][2:]))
+            ref = event['ref']
+            pushes.append({
+                'block': int(log['blockNumber'], 16),
+                'log_index': int(log['logIndex'], 16),
+                'transaction': log['transactionHash'],
+                'sender': event['sender'],
+                'ref': ref.decode('utf-8') if isinstance(ref, bytes) else ref,
+                'hash': encode_hex(event['hash'])[:40],
+                'content_address': event['contentAddress'],
+            })
+        return pushes
 
+    def _decode_result(self, function, response):
         if 'result' in response and response['result'] == '0x':
             response['result'] = []
         elif 'result' in response: